@@ -0,0 +1,154 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
+from app.core.config import settings, logger
+from app.core.metrics import ANALYSIS_CACHE_LOOKUPS
+from app.models import FailureSignature
+
+# Volatile fragments that differ between builds for the same root cause.
+# Order matters: UUIDs and timestamps must be replaced before the generic
+# number patterns chew them up.
+_NORMALIZERS = [
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<uuid>'),
+    (re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?'), '<ts>'),
+    (re.compile(r'\b\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\b'), '<ts>'),
+    (re.compile(r'0x[0-9a-fA-F]+'), '<addr>'),
+    (re.compile(r'@[0-9a-fA-F]{4,}\b'), '@<addr>'),
+    (re.compile(r'(\.\w+):\d+(?::\d+)?'), r'\1'),
+    (re.compile(r'\bline \d+'), 'line <n>'),
+    (re.compile(r'\$\$?Lambda\$\d+(?:/<addr>)?'), '$Lambda'),
+    (re.compile(r'\$\d+\b'), '$<n>'),
+    (re.compile(r'\b[0-9a-fA-F]{12,}\b'), '<id>'),
+    (re.compile(r'\b\d{5,}\b'), '<n>'),
+    (re.compile(r'[ \t]+'), ' '),
+]
+
+_lock = threading.Lock()
+_lru: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_stats = {
+    'memory_hits': 0,
+    'db_hits': 0,
+    'misses': 0,
+    'stores': 0,
+}
+
+def normalize_failure_text(text: str) -> str:
+    """Strip line numbers, addresses, timestamps and generated IDs from a trace."""
+    if not text:
+        return ''
+    for pattern, replacement in _NORMALIZERS:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+def normalized_failure(failure_data: Dict[str, Any]) -> str:
+    """Normalized message and trace, the text behind failure_signature."""
+    return '\n'.join([
+        normalize_failure_text(failure_data.get('message', '')),
+        normalize_failure_text(failure_data.get('trace', '')),
+    ])
+
+def failure_signature(failure_data: Dict[str, Any], normalized: Optional[str] = None) -> str:
+    """Hash of the normalized message and trace, stable across builds.
+
+    Callers that already hold normalized_failure(failure_data) can pass it
+    to skip normalizing again.
+    """
+    if normalized is None:
+        normalized = normalized_failure(failure_data)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+def _remember(signature: str, analysis: Dict[str, Any]):
+    with _lock:
+        _lru[signature] = analysis
+        _lru.move_to_end(signature)
+        while len(_lru) > settings.ANALYSIS_CACHE_SIZE:
+            _lru.popitem(last=False)
+
+def lookup_analysis(signature: str) -> Optional[Dict[str, Any]]:
+    """Return a cached analysis from the in-process LRU, or None."""
+    with _lock:
+        analysis = _lru.get(signature)
+        if analysis is not None:
+            _lru.move_to_end(signature)
+            _stats['memory_hits'] += 1
+            ANALYSIS_CACHE_LOOKUPS.labels('memory_hit').inc()
+            return analysis
+        _stats['misses'] += 1
+    ANALYSIS_CACHE_LOOKUPS.labels('miss').inc()
+    return None
+
+def store_analysis(signature: str, analysis: Dict[str, Any]):
+    """Cache an analysis in-process; the async path persists them (store_analyses)."""
+    _remember(signature, analysis)
+    with _lock:
+        _stats['stores'] += 1
+
+async def lookup_analyses(signatures: Iterable[str], session: Optional[AsyncSession] = None) -> Dict[str, Dict[str, Any]]:
+    """Batch lookup for the async path: LRU first, then one Postgres query for the rest.
+
+    An AsyncSession must not be shared by concurrent tasks, so the async
+    analysis path resolves every signature of an upload up front.
+    """
+    found = {}
+    missing = []
+    with _lock:
+        for signature in set(signatures):
+            analysis = _lru.get(signature)
+            if analysis is not None:
+                _lru.move_to_end(signature)
+                _stats['memory_hits'] += 1
+                ANALYSIS_CACHE_LOOKUPS.labels('memory_hit').inc()
+                found[signature] = analysis
+            else:
+                missing.append(signature)
+
+    if missing and session is not None:
+        try:
+            result = await session.execute(
+                select(FailureSignature.signature, FailureSignature.analysis)
+                .where(FailureSignature.signature.in_(missing))
+            )
+            for signature, analysis in result:
+                _remember(signature, analysis)
+                found[signature] = analysis
+        except Exception as e:
+            logger.warning(f"Failure signature lookup failed: {e}")
+
+    db_hits = sum(1 for signature in missing if signature in found)
+    with _lock:
+        _stats['db_hits'] += db_hits
+        _stats['misses'] += len(missing) - db_hits
+    ANALYSIS_CACHE_LOOKUPS.labels('db_hit').inc(db_hits)
+    ANALYSIS_CACHE_LOOKUPS.labels('miss').inc(len(missing) - db_hits)
+    return found
+
+async def store_analyses(analyses: Dict[str, Dict[str, Any]], session: Optional[AsyncSession] = None):
+    """Cache analyses in-process and, when a session is given, in Postgres.
+
+    The rows are written with the caller's transaction, together with the
+    test results they were produced for, in signature order, so concurrent
+    uploads take their row locks in the same order and cannot deadlock.
+    """
+    for signature, analysis in analyses.items():
+        _remember(signature, analysis)
+    with _lock:
+        _stats['stores'] += len(analyses)
+    if analyses and session is not None:
+        stmt = insert(FailureSignature).values([
+            {'signature': signature, 'analysis': analysis}
+            for signature, analysis in sorted(analyses.items())
+        ]).on_conflict_do_nothing(index_elements=['signature'])
+        await session.execute(stmt)
+
+def get_cache_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats['size'] = len(_lru)
+    lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+    stats['hit_ratio'] = (stats['memory_hits'] + stats['db_hits']) / lookups if lookups else 0.0
+    return stats
@@ -0,0 +1,198 @@
+"""Cross-class failure clustering, so one analysis covers many classes.
+
+When a shared dependency breaks, hundreds of classes fail with the same
+root cause. Before analysis, the failing classes of an upload are grouped:
+
+1. exactly, by the exception type and top application frames of the root
+   cause of each failure (the last ``Caused by:`` section when there is one)
+2. approximately, by merging groups with the same exception types whose
+   normalized failure text is near-identical, estimated with MinHash over
+   word shingles and found through LSH banding
+
+Each cluster is analyzed once through its representative class and the
+analysis is shared by every member.
+"""
+import hashlib
+import re
+import struct
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.cache import failure_signature, normalize_failure_text, normalized_failure
+from app.core.config import settings
+from app.core.frames import iter_innermost_frames
+from app.core.prompt import build_failure_input
+
+NUM_PERM = 64
+SHINGLE_SIZE = 3
+# Only the head of a failure is compared; it carries the message and root frames
+MAX_SHINGLE_CHARS = 2000
+
+# One extendable-output hash per shingle yields NUM_PERM independent 32-bit
+# hash values, standing in for NUM_PERM random permutations
+_UNPACK_HASHES = struct.Struct(f'<{NUM_PERM}I').unpack
+
+_CAUSED_BY_RE = re.compile(r'^[ \t]*Caused by:[ \t]*', re.MULTILINE)
+_EXCEPTION_RE = re.compile(r'^[ \t]*([A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*)(?::|$)')
+_TOKEN_RE = re.compile(r'[\w$<>]+')
+
+def root_cause(trace: str) -> str:
+    """The part of a trace describing the innermost cause."""
+    last = None
+    for last in _CAUSED_BY_RE.finditer(trace):
+        pass
+    return trace[last.end():] if last else trace
+
+def exception_type(message: str, trace: str) -> str:
+    """Exception class of the root cause, e.g. ``java.net.ConnectException``, or '' if unknown."""
+    lines = [line for line in root_cause(trace or '').splitlines() if line.strip()]
+    candidates = []
+    if lines:
+        # Python prints the exception last, after the frames
+        candidates.append(lines[-1] if lines[0].startswith('Traceback') else lines[0])
+    candidates.append(message or '')
+    for candidate in candidates:
+        match = _EXCEPTION_RE.match(candidate)
+        if match:
+            name = match.group(1)
+            if '.' in name or name.endswith(('Error', 'Exception', 'Failure', 'Throwable')):
+                return name
+    return ''
+
+def _is_framework(method: str, excluded_packages: List[str]) -> bool:
+    return bool(excluded_packages) and method.startswith(tuple(excluded_packages))
+
+def top_frames(trace: str, count: int, excluded_packages: Optional[List[str]] = None) -> Tuple[str, ...]:
+    """The `count` innermost non-framework frames of the root cause, without line numbers."""
+    if excluded_packages is None:
+        excluded_packages = settings.PROMPT_EXCLUDED_PACKAGES
+    frames = []
+    for frame in iter_innermost_frames(root_cause(trace or '')):
+        # Drop the JPMS module prefix, e.g. java.base/java.net.Socket.connect
+        method = (frame['method'] or '').rsplit('/', 1)[-1]
+        if _is_framework(method, excluded_packages):
+            continue
+        frames.append(f"{frame['file']}:{method}")
+        if len(frames) >= count:
+            break
+    return tuple(frames)
+
+def failure_key(failure_data: Dict[str, Any], frame_count: int) -> Tuple[str, Tuple[str, ...]]:
+    exception = exception_type(failure_data.get('message'), failure_data.get('trace'))
+    frames = top_frames(failure_data.get('trace'), frame_count)
+    if not exception and not frames:
+        # Nothing structural to go on, so only identical messages group together
+        return '', (normalize_failure_text(failure_data.get('message', '')),)
+    return exception, frames
+
+def shingles(text: str) -> set:
+    """Word SHINGLE_SIZE-grams of `text`."""
+    tokens = _TOKEN_RE.findall(text[:MAX_SHINGLE_CHARS])
+    if len(tokens) < SHINGLE_SIZE:
+        tokens = tokens + [''] * (SHINGLE_SIZE - len(tokens))
+    return {' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+def minhash(text: str) -> Tuple[int, ...]:
+    """MinHash signature of the word shingles of `text`."""
+    rows = [
+        _UNPACK_HASHES(hashlib.shake_128(shingle.encode('utf-8')).digest(NUM_PERM * 4))
+        for shingle in shingles(text)
+    ]
+    return tuple(map(min, zip(*rows)))
+
+def estimated_similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+def lsh_bands(threshold: float) -> int:
+    """Number of bands whose LSH candidate threshold, (1/b)^(1/r), is closest below `threshold`.
+
+    Tuning the banding to the threshold keeps dissimilar pairs from becoming
+    candidates, which would each cost a full signature comparison.
+    """
+    options = [bands for bands in range(1, NUM_PERM + 1) if NUM_PERM % bands == 0]
+    below = [bands for bands in options if (1 / bands) ** (bands / NUM_PERM) <= threshold]
+    if not below:
+        return NUM_PERM
+    return min(below, key=lambda bands: threshold - (1 / bands) ** (bands / NUM_PERM))
+
+def _find(parents: List[int], index: int) -> int:
+    while parents[index] != index:
+        parents[index] = parents[parents[index]]
+        index = parents[index]
+    return index
+
+def cluster_failures(
+        class_results,
+        frame_count: Optional[int] = None,
+        similarity_threshold: Optional[float] = None
+        ) -> List[Dict[str, Any]]:
+    """Group the failing classes of `class_results` into clusters sharing a root cause.
+
+    Returns one dict per cluster with the member ``classes``, the
+    ``representative`` class, its ``failure_input`` (the budgeted model
+    input) and the cache ``signature`` of that input.
+    """
+    if frame_count is None:
+        frame_count = settings.CLUSTER_TOP_FRAMES
+    if similarity_threshold is None:
+        similarity_threshold = settings.CLUSTER_SIMILARITY_THRESHOLD
+
+    # Exact grouping by the set of (exception type, top frames) of each class
+    groups: Dict[Tuple, List[str]] = {}
+    for class_name, results in class_results.items():
+        if results['total_tests'] > 0 and results['failure_details']:
+            key = tuple(sorted({failure_key(failure, frame_count) for failure in results['failure_details']}))
+            groups.setdefault(key, []).append(class_name)
+
+    keys = list(groups)
+    inputs = []
+    for key in keys:
+        # The class with the most failures shows the cause most completely
+        representative = max(groups[key], key=lambda name: len(class_results[name]['failure_details']))
+        failure_input = build_failure_input(class_results[representative]['failure_details'])
+        inputs.append((representative, failure_input, normalized_failure(failure_input)))
+
+    # Near-duplicate merging between groups with the same exception types
+    parents = list(range(len(keys)))
+    exception_types = [tuple(sorted({exception for exception, _ in key})) for key in keys]
+    type_counts = Counter(exception_types)
+    if similarity_threshold <= 1 and len(keys) > 1:
+        bands = lsh_bands(similarity_threshold)
+        rows = NUM_PERM // bands
+        signatures = {}
+        # Each bucket keeps one member per cluster, so a build failing the
+        # same way everywhere leaves every bucket with a single entry
+        buckets: Dict[Tuple, Dict[int, int]] = {}
+        for index, types in enumerate(exception_types):
+            if type_counts[types] < 2:
+                # Nothing else to merge with, so skip the signature
+                continue
+            signature = signatures[index] = minhash(inputs[index][2])
+            band_keys = [
+                (types, band, signature[band * rows:(band + 1) * rows])
+                for band in range(bands)
+            ]
+            candidates = set()
+            for band_key in band_keys:
+                candidates.update(buckets.get(band_key, {}).values())
+            for other in sorted(candidates):
+                root, other_root = _find(parents, index), _find(parents, other)
+                if root != other_root and estimated_similarity(signature, signatures[other]) >= similarity_threshold:
+                    parents[max(root, other_root)] = min(root, other_root)
+            root = _find(parents, index)
+            for band_key in band_keys:
+                buckets.setdefault(band_key, {}).setdefault(root, index)
+
+    clusters: Dict[int, Dict[str, Any]] = {}
+    for index, key in enumerate(keys):
+        root = _find(parents, index)
+        if root not in clusters:
+            representative, failure_input, normalized = inputs[root]
+            clusters[root] = {
+                'representative': representative,
+                'classes': [],
+                'failure_input': failure_input,
+                'signature': failure_signature(failure_input, normalized),
+            }
+        clusters[root]['classes'].extend(groups[key])
+    return list(clusters.values())
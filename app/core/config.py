@@ -1,15 +1,15 @@
 import os
-from typing import Any, List
+from typing import Any, List, Optional
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings  #ignore 
 from functools import lru_cache
 import logging
-import google.generativeai as genai
+import threading
 # Force load from .env file first
 load_dotenv(override=True)  # Add override=True
 
 class Settings(BaseSettings):
-    GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY")
+    GOOGLE_API_KEY: Optional[str] = os.getenv("GOOGLE_API_KEY")  # Only needed by the gemini and record backends
     DB_USER: str = os.getenv("DB_USER", "postgres")
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "postgres")
     DB_SCHEMA: str = os.getenv("DB_SCHEMA", "public")  # Default to public schema if not specified
@@ -17,8 +17,55 @@ class Settings(BaseSettings):
     DB_NAME: str = os.getenv("DB_NAME", "jenkins_debug")
     DB_ENDPOINT: str = os.getenv("DB_ENDPOINT", "localhost")
     DB_PORT: str = os.getenv("DB_PORT", "5432")  # Default PostgreSQL port
+    ANALYSIS_CACHE_SIZE: int = int(os.getenv("ANALYSIS_CACHE_SIZE", "1024"))  # In-process LRU entries
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # Parallel analyses per upload
+    LLM_RPM: int = int(os.getenv("LLM_RPM", "60"))  # Model requests per minute, 0 disables the limit
+    LLM_TPM: int = int(os.getenv("LLM_TPM", "1000000"))  # Model input tokens per minute, 0 disables the limit
+    JOB_POLL_INTERVAL_SECONDS: float = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "2"))  # Idle worker sleep
+    JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", "600"))  # Running jobs older than this are reclaimed
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    STAGED_BUILD_TTL_SECONDS: int = int(os.getenv("STAGED_BUILD_TTL_SECONDS", str(24 * 3600)))  # Staged parts of a build never finalized are dropped after this
+    WORKER_METRICS_PORT: int = int(os.getenv("WORKER_METRICS_PORT", "9100"))  # Worker /metrics port, 0 disables
+    PROMPT_TOKEN_BUDGET: int = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))  # Max input tokens per analysis prompt
+    PROMPT_EXCLUDED_PACKAGES_CSV: str = os.getenv(
+        "PROMPT_EXCLUDED_PACKAGES",
+        "org.junit,junit.framework,sun.reflect,jdk.internal,java.lang.reflect,"
+        "org.gradle,org.apache.maven.surefire,org.testng,org.mockito.internal"
+    )  # Stack frames from these packages are left out of prompts
+    FLAKY_WINDOW: int = int(os.getenv("FLAKY_WINDOW", "20"))  # Runs in the rolling flakiness window
+    FLAKY_EWMA_ALPHA: float = float(os.getenv("FLAKY_EWMA_ALPHA", "0.2"))  # Weight of the newest run in the fail rate
+    HISTORY_PARTITION_MONTHS_AHEAD: int = int(os.getenv("HISTORY_PARTITION_MONTHS_AHEAD", "3"))  # Monthly history partitions created ahead
+    HISTORY_PARTITION_CHECK_SECONDS: int = int(os.getenv("HISTORY_PARTITION_CHECK_SECONDS", str(6 * 3600)))  # Interval of the partition maintenance in the API and workers
+    TRACE_COMPRESSION_LEVEL: int = int(os.getenv("TRACE_COMPRESSION_LEVEL", "6"))  # zlib level of stored stack traces
+    UPSERT_BATCH_SIZE: int = int(os.getenv("UPSERT_BATCH_SIZE", "1000"))  # Classes per INSERT ... ON CONFLICT statement
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))  # Bytes read per upload chunk
+    UPLOAD_STORE_CHUNK_BYTES: int = int(os.getenv("UPLOAD_STORE_CHUNK_BYTES", str(4 * 1024 * 1024)))  # Bytes per stored chunk of a queued upload
+    UPLOAD_MAX_BUFFER_BYTES: int = int(os.getenv("UPLOAD_MAX_BUFFER_BYTES", str(16 * 1024 * 1024)))  # Largest single record held in memory
+    UPLOAD_ARCHIVE_MEMBER_PATTERNS_CSV: str = os.getenv(
+        "UPLOAD_ARCHIVE_MEMBER_PATTERNS", "*-result.json"
+    )  # Members of uploaded .zip/.tar.gz archives that are read as results; attachments are skipped
+    CLUSTER_TOP_FRAMES: int = int(os.getenv("CLUSTER_TOP_FRAMES", "3"))  # Root-cause frames that must match for classes to share an analysis
+    CLUSTER_SIMILARITY_THRESHOLD: float = float(os.getenv("CLUSTER_SIMILARITY_THRESHOLD", "0.8"))  # Estimated Jaccard similarity for near-duplicate merging, above 1 disables it
+    SIMILARITY_THRESHOLD: float = float(os.getenv("SIMILARITY_THRESHOLD", "0.9"))  # Cosine similarity to past failures that skips the model, above 1 disables it
+    SIMILARITY_TOP_K: int = int(os.getenv("SIMILARITY_TOP_K", "3"))  # Past failures consulted per lookup
+    SIMILARITY_HISTORY_DAYS: int = int(os.getenv("SIMILARITY_HISTORY_DAYS", "90"))  # Classes updated this recently are indexed at startup
+    SIMILARITY_MAX_INDEXED: int = int(os.getenv("SIMILARITY_MAX_INDEXED", "100000"))  # Most recent classes indexed at startup
+    SIMILARITY_DIMENSIONS: int = int(os.getenv("SIMILARITY_DIMENSIONS", "1024"))  # Hashed features per failure vector
+    READ_CACHE_SIZE: int = int(os.getenv("READ_CACHE_SIZE", "2048"))  # Class versions and response bodies kept in-process
+    READ_CACHE_TTL_SECONDS: float = float(os.getenv("READ_CACHE_TTL_SECONDS", "30"))  # How long a cached class version is trusted, 0 disables the cache
+    ANALYSIS_BACKEND: str = os.getenv("ANALYSIS_BACKEND", "gemini")  # gemini, stub, record or replay (see app.core.llm)
+    ANALYSIS_STUB_LATENCY_SECONDS: float = float(os.getenv("ANALYSIS_STUB_LATENCY_SECONDS", "0"))  # Simulated model latency of the stub
+    ANALYSIS_RECORD_DIR: str = os.getenv("ANALYSIS_RECORD_DIR", "recordings")  # Responses saved by record, served by replay
 
     
+    @property
+    def PROMPT_EXCLUDED_PACKAGES(self) -> List[str]:
+        return [package.strip() for package in self.PROMPT_EXCLUDED_PACKAGES_CSV.split(",") if package.strip()]
+
+    @property
+    def UPLOAD_ARCHIVE_MEMBER_PATTERNS(self) -> List[str]:
+        return [pattern.strip() for pattern in self.UPLOAD_ARCHIVE_MEMBER_PATTERNS_CSV.split(",") if pattern.strip()]
+
     @property
     def BACKEND_URL(self):
         if self.ENVIRONMENT == "prod":
@@ -32,6 +79,10 @@ class Settings(BaseSettings):
             
         return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_ENDPOINT}:{self.DB_PORT}/{self.DB_NAME}"
 
+    def DB_ASYNC_CONNECTION_STRING(self, environment: str = None):
+        """Same database as DB_CONNECTION_STRING, through the asyncpg driver."""
+        return self.DB_CONNECTION_STRING(environment).replace("postgresql://", "postgresql+asyncpg://", 1)
+
     @property
     def CORS_ORIGINS(self):
         if self.ENVIRONMENT == "prod":
@@ -54,10 +105,26 @@ def get_logger():
     logging.basicConfig(level=logging.DEBUG)
     return logging.getLogger(__name__)
 
-@lru_cache()
+_model = None
+_model_pid = None
+_model_lock = threading.Lock()
+
 def get_model():
-    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-    return genai.GenerativeModel('gemini-2.0-flash')
+    """The Gemini model client, created on first use and reused within the process.
+
+    google.generativeai is imported here rather than at module level, so
+    startup and parse-only paths never load the SDK. A forked child builds
+    its own client instead of reusing the parent's gRPC channel.
+    """
+    global _model, _model_pid
+    if _model is None or _model_pid != os.getpid():
+        with _model_lock:
+            if _model is None or _model_pid != os.getpid():
+                import google.generativeai as genai
+                genai.configure(api_key=settings.GOOGLE_API_KEY)
+                _model = genai.GenerativeModel('gemini-2.0-flash')
+                _model_pid = os.getpid()
+    return _model
 
 
 settings = get_settings()
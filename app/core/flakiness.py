@@ -0,0 +1,131 @@
+"""Incremental flakiness statistics per test method.
+
+Every ingested outcome updates a test's stored statistics in O(1): the
+pass/fail flip rate over a rolling window of the last FLAKY_WINDOW runs,
+the distribution of consecutive pass/fail run lengths and an
+exponentially weighted fail rate. History is never rescanned, and the
+top-N query is an index scan on the stored score.
+"""
+from typing import Any, Dict, List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
+from app.core.config import settings
+from app.models import TestFlakiness, utcnow
+
+PASSED = 'P'
+FAILED = 'F'
+
+def new_stats(test_id: str, test_name: str) -> Dict[str, Any]:
+    return {
+        'test_id': test_id,
+        'test_name': test_name,
+        'runs': 0,
+        'failures': 0,
+        'flips': 0,
+        'window': '',
+        'window_flips': 0,
+        'last_status': None,
+        'current_run_length': 0,
+        'run_lengths': {PASSED: {}, FAILED: {}},
+        'ewma_fail_rate': 0.0,
+        'flakiness_score': 0.0,
+    }
+
+def update_stats(stats: Dict[str, Any], outcome: str, window_size: int = None, alpha: float = None) -> Dict[str, Any]:
+    """Fold one outcome ('P' or 'F') into a test's statistics in place."""
+    window_size = window_size or settings.FLAKY_WINDOW
+    alpha = alpha if alpha is not None else settings.FLAKY_EWMA_ALPHA
+
+    # Run lengths: a flip closes the current run of identical outcomes
+    if stats['last_status'] is not None and outcome != stats['last_status']:
+        stats['flips'] += 1
+        histogram = stats['run_lengths'][stats['last_status']]
+        length = str(stats['current_run_length'])
+        histogram[length] = histogram.get(length, 0) + 1
+        stats['current_run_length'] = 1
+    else:
+        stats['current_run_length'] += 1
+
+    # Rolling window: count the flip entering and the one leaving it
+    window = stats['window']
+    if window and window[-1] != outcome:
+        stats['window_flips'] += 1
+    window += outcome
+    if len(window) > window_size:
+        if window[0] != window[1]:
+            stats['window_flips'] -= 1
+        window = window[1:]
+    stats['window'] = window
+
+    failed = 1.0 if outcome == FAILED else 0.0
+    if stats['runs'] == 0:
+        stats['ewma_fail_rate'] = failed
+    else:
+        stats['ewma_fail_rate'] = alpha * failed + (1 - alpha) * stats['ewma_fail_rate']
+
+    stats['runs'] += 1
+    stats['failures'] += int(failed)
+    stats['last_status'] = outcome
+    # Share of consecutive runs in the window whose outcome changed
+    stats['flakiness_score'] = stats['window_flips'] / (len(window) - 1) if len(window) > 1 else 0.0
+    return stats
+
+def run_outcomes(class_results) -> Dict[str, Dict[str, Any]]:
+    """Pass/fail outcomes of a run per test method, in the order they were ingested."""
+    outcomes = {}
+    for class_name, result in class_results.items():
+        for test_case in result['cases']:
+            if test_case['status'] not in ('passed', 'failed'):
+                continue
+            test_id = test_case['full_test_name'] or f"{class_name}.{test_case['test_method']}"
+            entry = outcomes.setdefault(test_id, {'test_name': class_name, 'outcomes': []})
+            entry['outcomes'].append(PASSED if test_case['status'] == 'passed' else FAILED)
+    return outcomes
+
+async def update_flakiness(class_results, session: AsyncSession):
+    """Apply a run's outcomes to test_flakiness with locked reads and batched upserts per chunk.
+
+    Tests seen for the first time get an empty row (ON CONFLICT DO NOTHING)
+    before the FOR UPDATE read, so every row of the batch is locked and a
+    concurrent run waits and builds on this one instead of overwriting it.
+    Keys are locked in sorted order, so concurrent runs cannot deadlock.
+    """
+    outcomes = run_outcomes(class_results)
+    test_ids = sorted(outcomes)
+    columns = [column.name for column in TestFlakiness.__table__.columns if column.name != 'updated_at']
+    for start in range(0, len(test_ids), settings.UPSERT_BATCH_SIZE):
+        batch = test_ids[start:start + settings.UPSERT_BATCH_SIZE]
+        await session.execute(
+            insert(TestFlakiness)
+            .values([dict(new_stats(test_id, outcomes[test_id]['test_name']), updated_at=utcnow()) for test_id in batch])
+            .on_conflict_do_nothing(index_elements=[TestFlakiness.test_id])
+        )
+        existing = await session.execute(
+            select(TestFlakiness)
+            .where(TestFlakiness.test_id.in_(batch))
+            .order_by(TestFlakiness.test_id)
+            .with_for_update()
+        )
+        stored = {
+            row.test_id: {column: getattr(row, column) for column in columns}
+            for row in existing.scalars()
+        }
+
+        rows: List[Dict[str, Any]] = []
+        for test_id in batch:
+            stats = stored.get(test_id) or new_stats(test_id, outcomes[test_id]['test_name'])
+            stats['run_lengths'] = {
+                status: dict(histogram) for status, histogram in (stats['run_lengths'] or {PASSED: {}, FAILED: {}}).items()
+            }
+            for outcome in outcomes[test_id]['outcomes']:
+                update_stats(stats, outcome)
+            stats['updated_at'] = utcnow()
+            rows.append(stats)
+
+        stmt = insert(TestFlakiness).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TestFlakiness.test_id],
+            set_={column: stmt.excluded[column] for column in columns + ['updated_at'] if column != 'test_id'}
+        )
+        await session.execute(stmt)
@@ -0,0 +1,112 @@
+"""Stack-trace frame parsing shared by the service and the ``main.py`` CLI.
+
+All supported formats are matched by one precompiled pattern that scans the
+whole trace in a single pass, instead of splitting and probing every line.
+Frames come back as dicts with ``language``, ``file``, ``line`` (int or
+None), ``method`` and ``full_stack_line``.
+"""
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+_FRAME_RE = re.compile(
+    r"""
+    # Java / Kotlin: at com.example.Foo.bar(Foo.java:42), at java.base/...(Thread.java:833)
+    (?P<jvm>^[ \t]*at[ \t]+(?P<jvm_method>[\w$.<>/\-]+)\((?P<jvm_file>[^():\n]*)(?::(?P<jvm_line>\d+))?\))
+    |
+    # Python: File "app/x.py", line 12, in func
+    (?P<python>^[ \t]*File[ \t]+"(?P<py_file>[^"\n]+)",[ \t]+line[ \t]+(?P<py_line>\d+)(?:,[ \t]+in[ \t]+(?P<py_method>[^\s]+))?)
+    |
+    # JavaScript / TypeScript: at fn (src/x.ts:12:5), at src/x.js:12:5
+    (?P<js>^[ \t]*at[ \t]+(?:(?:async[ \t]+|new[ \t]+)?(?P<js_method>[^\s()]+(?:[ \t]\[as[ \t][^\]\n]+\])?)[ \t]+\()?
+        (?P<js_file>[^()\s]+?):(?P<js_line>\d+):\d+\)?[ \t]*$)
+    |
+    # Go: main.handler(0x1, 0x2)\n\t/src/app/main.go:42 +0x1d
+    (?P<go>^(?P<go_method>[\w.\-/*()]+?)\([^)\n]*\)[ \t]*\n[ \t]+(?P<go_file>[^\s:]+\.go):(?P<go_line>\d+))
+    """,
+    re.MULTILINE | re.VERBOSE,
+)
+
+def _frame(match: re.Match) -> Dict[str, Any]:
+    kind = match.lastgroup
+    if kind == 'jvm':
+        file_name = match.group('jvm_file')
+        line = match.group('jvm_line')
+        return {
+            'language': 'kotlin' if file_name.endswith('.kt') else 'java',
+            'file': file_name,
+            'line': int(line) if line else None,
+            'method': match.group('jvm_method'),
+            'full_stack_line': match.group(0).strip(),
+        }
+    if kind == 'python':
+        return {
+            'language': 'python',
+            'file': match.group('py_file'),
+            'line': int(match.group('py_line')),
+            'method': match.group('py_method'),
+            'full_stack_line': match.group(0).strip(),
+        }
+    if kind == 'js':
+        file_name = match.group('js_file')
+        return {
+            'language': 'typescript' if file_name.endswith(('.ts', '.tsx')) else 'javascript',
+            'file': file_name,
+            'line': int(match.group('js_line')),
+            'method': match.group('js_method'),
+            'full_stack_line': match.group(0).strip(),
+        }
+    return {
+        'language': 'go',
+        'file': match.group('go_file'),
+        'line': int(match.group('go_line')),
+        'method': match.group('go_method'),
+        'full_stack_line': ' '.join(match.group(0).split()),
+    }
+
+def iter_frames(trace: str) -> Iterator[Dict[str, Any]]:
+    """Yield the frames of a stack trace lazily, for callers that stop early."""
+    if not trace:
+        return
+    for match in _FRAME_RE.finditer(trace):
+        yield _frame(match)
+
+def iter_innermost_frames(trace: str) -> Iterator[Dict[str, Any]]:
+    """Yield frames starting where the failure happened.
+
+    Traces are in that order already, except Python tracebacks, which are
+    printed most recent call last and are yielded reversed.
+    """
+    frames = iter_frames(trace)
+    first = next(frames, None)
+    if first is None:
+        return
+    if first['language'] == 'python':
+        yield from reversed([first, *frames])
+    else:
+        yield first
+        yield from frames
+
+def parse_frames(trace: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Return the frames of a stack trace in order, stopping after `limit` frames."""
+    frames = []
+    for frame in iter_frames(trace):
+        frames.append(frame)
+        if limit is not None and len(frames) >= limit:
+            break
+    return frames
+
+def parse_frame_line(line: str) -> Optional[Dict[str, Any]]:
+    """Parse a single trace line, or return None if it is not a frame."""
+    match = _FRAME_RE.match(line)
+    return _frame(match) if match else None
+
+def parse_frames_batch(traces: Iterable[str], limit: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+    """Parse many traces in one call; the result is aligned with `traces`."""
+    return [parse_frames(trace, limit) for trace in traces]
+
+def first_frame(trace: str) -> Optional[Dict[str, Any]]:
+    """The innermost frame that carries a line number, i.e. where the failure happened."""
+    return next((frame for frame in iter_innermost_frames(trace) if frame['line'] is not None), None)
+
+def first_frames_batch(traces: Iterable[str]) -> List[Optional[Dict[str, Any]]]:
+    return [first_frame(trace) for trace in traces]
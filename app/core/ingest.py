@@ -0,0 +1,508 @@
+import asyncio
+import tempfile
+import time
+from datetime import timedelta
+from collections import defaultdict
+from itertools import islice
+from typing import Any, AsyncIterable, Dict, Iterable, Iterator, List, Optional, Tuple
+from fastapi import UploadFile
+from sqlalchemy import delete, case, select, literal, cast, String
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
+from app.core.config import settings
+from app.core import readcache
+from app.core.utils import process_test_file, lookup_known_analyses, complete_analyses
+from app.core.cache import store_analyses
+from app.core.flakiness import update_flakiness
+from app.core.cluster import exception_type
+from app.core.traces import collect_traces, externalize_traces, store_traces
+from app.core.metrics import observe_stage, UPLOAD_BYTES, UPLOAD_RECORDS
+from app.core.stream import aiter_chunk_records, aiter_upload_records, is_archive, iter_archive_members, iter_file_records
+from app.models import TestResult, TestResultHistory, BuildClassResult, TestRun, TestCaseResult, utcnow, utcnow_sql
+
+# Records of an archive member decoded per worker-thread hop
+ARCHIVE_RECORD_BATCH = 64
+
+def new_class_results():
+    return defaultdict(lambda: {
+        'total_tests': 0,
+        'passed': 0,
+        'failed': 0,
+        'fail_percentage': 0,
+        'failure_details': [],
+        'cases': [],
+        'analysis': {
+            'causes': [],
+            'solutions': []
+        }
+    })
+
+def add_test_info(class_results, test_info, filename):
+    """Fold one processed test record into the per-class accumulator."""
+    if test_info and test_info['class_name']:
+        class_name = test_info['class_name']
+        class_results[class_name]['total_tests'] += 1
+        
+        if test_info['status'] == 'passed':
+            class_results[class_name]['passed'] += 1
+        elif test_info['status'] == 'failed':
+            class_results[class_name]['failed'] += 1
+            if test_info['failure_data']:
+                # Add test file information to failure details
+                failure_data = test_info['failure_data']
+                failure_data['test_file'] = filename
+                class_results[class_name]['failure_details'].append(failure_data)
+        
+        # Every test outcome is kept for the append-only run history
+        failure_data = test_info['failure_data'] or {}
+        failure_location = failure_data.get('failure_location') or {}
+        exception = exception_type(failure_data.get('message'), failure_data.get('trace')) if failure_data else ''
+        class_results[class_name]['cases'].append({
+            'test_method': test_info['test_method'],
+            'full_test_name': test_info['full_test_name'],
+            'status': test_info['status'],
+            'duration_ms': test_info['duration_ms'],
+            'message': failure_data.get('message'),
+            'trace': failure_data.get('trace'),
+            'failure_location': failure_data.get('failure_location'),
+            'test_file': filename,
+            'exception_type': exception or None,
+            'failure_file': failure_location.get('file'),
+            'failure_method': failure_location.get('method')
+        })
+
+def merge_class_results(target, *sources):
+    """Add the counters and failures of each of `sources` into the accumulator `target`."""
+    for source in sources:
+        for class_name, result in source.items():
+            merged = target[class_name]
+            merged['total_tests'] += result['total_tests']
+            merged['passed'] += result['passed']
+            merged['failed'] += result['failed']
+            merged['failure_details'].extend(result['failure_details'] or [])
+            merged['cases'].extend(result['cases'] or [])
+    return target
+
+async def stage_build_results(build_id: str, class_results, session: AsyncSession):
+    """Add a partial upload of a multi-request build to build_class_results."""
+    rows = [
+        {
+            'build_id': build_id,
+            'test_name': class_name,
+            'total_tests': result['total_tests'],
+            'passed': result['passed'],
+            'failed': result['failed'],
+            'failure_details': result['failure_details'],
+            'cases': result['cases'],
+            'updated_at': utcnow_sql()
+        }
+        # Sorted, so concurrent uploads take their row locks in the same order
+        for class_name, result in sorted(class_results.items())
+    ]
+    for start in range(0, len(rows), settings.UPSERT_BATCH_SIZE):
+        stmt = insert(BuildClassResult).values(rows[start:start + settings.UPSERT_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[BuildClassResult.build_id, BuildClassResult.test_name],
+            set_={
+                'total_tests': BuildClassResult.total_tests + stmt.excluded.total_tests,
+                'passed': BuildClassResult.passed + stmt.excluded.passed,
+                'failed': BuildClassResult.failed + stmt.excluded.failed,
+                'failure_details': BuildClassResult.failure_details.op('||')(stmt.excluded.failure_details),
+                'cases': BuildClassResult.cases.op('||')(stmt.excluded.cases),
+                'updated_at': utcnow_sql()
+            }
+        )
+        await session.execute(stmt)
+
+def _staged_columns():
+    return (
+        BuildClassResult.test_name,
+        BuildClassResult.total_tests,
+        BuildClassResult.passed,
+        BuildClassResult.failed,
+        BuildClassResult.failure_details,
+        BuildClassResult.cases
+    )
+
+def _staged_class_results(rows):
+    staged = new_class_results()
+    for row in rows:
+        staged[row.test_name].update(
+            total_tests=row.total_tests,
+            passed=row.passed,
+            failed=row.failed,
+            failure_details=row.failure_details or [],
+            cases=row.cases or []
+        )
+    return staged
+
+async def read_staged_build_results(build_id: str, session: AsyncSession):
+    """Everything staged for a build so far as a class accumulator, without taking it."""
+    stmt = select(*_staged_columns()).where(BuildClassResult.build_id == build_id)
+    return _staged_class_results(await session.execute(stmt))
+
+async def take_staged_build_results(build_id: str, session: AsyncSession):
+    """Remove and return everything staged for a build as a class accumulator."""
+    stmt = delete(BuildClassResult).where(BuildClassResult.build_id == build_id).returning(*_staged_columns())
+    return _staged_class_results(await session.execute(stmt))
+
+async def purge_abandoned_builds(session: AsyncSession) -> int:
+    """Drop staged parts of builds untouched for STAGED_BUILD_TTL_SECONDS; nothing is committed here.
+
+    A part staged after its build's final upload, or of a build whose final
+    upload never came, would otherwise stay in build_class_results forever.
+    """
+    result = await session.execute(
+        delete(BuildClassResult)
+        .where(BuildClassResult.updated_at < utcnow_sql() - timedelta(seconds=settings.STAGED_BUILD_TTL_SECONDS))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+async def record_run(class_results, session: AsyncSession, build_id: Optional[str] = None) -> int:
+    """Append the run and every test outcome to test_runs / test_case_results."""
+    run_at = utcnow()
+    run_id = (await session.execute(
+        insert(TestRun).values(
+            build_id=build_id,
+            run_at=run_at,
+            total_tests=sum(result['total_tests'] for result in class_results.values()),
+            passed=sum(result['passed'] for result in class_results.values()),
+            failed=sum(result['failed'] for result in class_results.values())
+        ).returning(TestRun.id)
+    )).scalar_one()
+
+    rows = [
+        dict(test_case, run_id=run_id, test_name=class_name, run_at=run_at)
+        for class_name, result in class_results.items()
+        for test_case in externalize_traces(result['cases'])
+    ]
+    # executemany is batched into multi-row INSERTs by SQLAlchemy
+    for start in range(0, len(rows), settings.UPSERT_BATCH_SIZE):
+        await session.execute(insert(TestCaseResult), rows[start:start + settings.UPSERT_BATCH_SIZE])
+    return run_id
+
+async def upsert_class_results(class_results, session: AsyncSession):
+    """Fold a run into the test_results summaries with batched INSERT ... ON CONFLICT.
+
+    Each batch also appends the resulting rows to test_result_history in the
+    same statement, so versioned history costs no extra round trip or commit.
+
+    Every column describes the latest run (a whole build, when it was
+    uploaded over several requests), so counters, fail_percentage, failure
+    details and analysis stay consistent with each other; totals across
+    runs live in test_runs / test_case_results and test_flakiness. The
+    version bump and timestamps (in UTC) are computed by Postgres. Each batch is a
+    single statement and round trip. Nothing is committed here.
+    """
+    rows = []
+    # Sorted, so concurrent uploads sharing classes take their row locks in
+    # the same order and cannot deadlock
+    for class_name, result in sorted(class_results.items()):
+        # Calculate fail percentage
+        if result['total_tests'] > 0:
+            result['fail_percentage'] = (result['failed'] / result['total_tests']) * 100
+        rows.append({
+            'test_name': class_name,
+            'total_tests': result['total_tests'],
+            'passed': result['passed'],
+            'failed': result['failed'],
+            'fail_percentage': result['fail_percentage'],
+            'failure_details': externalize_traces(result['failure_details']),
+            'analysis': result['analysis'],
+            'last_updated': utcnow_sql(),
+            'created_at': utcnow_sql(),
+            'updated_at': utcnow_sql()
+        })
+
+    # Keep each statement well under Postgres' 65535 bind parameter limit
+    for start in range(0, len(rows), settings.UPSERT_BATCH_SIZE):
+        stmt = insert(TestResult).values(rows[start:start + settings.UPSERT_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TestResult.test_name],
+            set_={
+                'total_tests': stmt.excluded.total_tests,
+                'passed': stmt.excluded.passed,
+                'failed': stmt.excluded.failed,
+                'fail_percentage': stmt.excluded.fail_percentage,
+                'failure_details': stmt.excluded.failure_details,
+                'analysis': stmt.excluded.analysis,
+                'last_updated': utcnow_sql(),
+                'updated_at': utcnow_sql(),
+                'version': TestResult.version + 1
+            }
+        ).returning(
+            TestResult.test_name,
+            TestResult.version,
+            TestResult.total_tests,
+            TestResult.passed,
+            TestResult.failed,
+            TestResult.fail_percentage,
+            TestResult.failure_details,
+            TestResult.analysis
+        )
+        # History rows are written by the same statement, from the upserted rows
+        upserted = stmt.cte("upserted")
+        history = insert(TestResultHistory).from_select(
+            [
+                'test_name', 'version', 'total_tests', 'passed', 'failed', 'fail_percentage',
+                'failure_details', 'analysis', 'change_type', 'changed_by', 'change_reason', 'changed_at'
+            ],
+            select(
+                upserted.c.test_name,
+                upserted.c.version,
+                upserted.c.total_tests,
+                upserted.c.passed,
+                upserted.c.failed,
+                upserted.c.fail_percentage,
+                upserted.c.failure_details,
+                upserted.c.analysis,
+                case((upserted.c.version == 1, 'create'), else_='update'),
+                literal('system'),
+                case(
+                    (upserted.c.version == 1, 'Initial test result creation'),
+                    else_=literal('Updated test result to version ') + cast(upserted.c.version, String)
+                ),
+                # Explicit, as tables created before the UTC default still default to now()
+                utcnow_sql()
+            )
+        )
+        await session.execute(history)
+
+async def store_build_results(
+        class_results,
+        session: AsyncSession,
+        build_id: Optional[str] = None,
+        final: bool = True,
+        commit: bool = True
+        ):
+    """Analyze and write an aggregated build, or stage it until the build is final.
+
+    Analysis runs once per class over every file of the build, and all
+    classes are written in one transaction. Known analyses are looked up
+    first and that read transaction is committed before the model is
+    called, so the session holds no connection while analyses run; the
+    caller must not have uncommitted changes in it. With `commit=False`
+    the write transaction is left open, so the caller can add its own
+    changes (the job worker marks the job done) and commit them atomically.
+    """
+    if build_id is not None and not final:
+        start = time.perf_counter()
+        await stage_build_results(build_id, class_results, session)
+        if commit:
+            await session.commit()
+        observe_stage('db_commit', time.perf_counter() - start, len(class_results))
+        return
+
+    # Analysis input: this upload plus whatever is staged for the build
+    analyzed = class_results
+    if build_id is not None:
+        analyzed = merge_class_results(
+            new_class_results(), class_results, await read_staged_build_results(build_id, session)
+        )
+
+    start = time.perf_counter()
+    by_signature, cached = await lookup_known_analyses(analyzed, session)
+    # End the read transaction so no pooled connection sits idle in
+    # transaction, holding locks, during the model calls
+    await session.commit()
+    fresh = await complete_analyses(analyzed, by_signature, cached)
+    observe_stage('analysis', time.perf_counter() - start, len(analyzed))
+
+    if build_id is not None:
+        # Taken in the write transaction, so partial uploads staged while
+        # the model ran are stored too (their classes keep the analysis of
+        # what was staged before)
+        class_results = merge_class_results(
+            new_class_results(), class_results, await take_staged_build_results(build_id, session)
+        )
+        for class_name, result in class_results.items():
+            if class_name in analyzed:
+                result['analysis'] = analyzed[class_name]['analysis']
+
+    start = time.perf_counter()
+    await store_analyses(fresh, session)
+    # Traces are referenced by hash from the rows below
+    await store_traces(collect_traces(class_results), session)
+    await record_run(class_results, session, build_id)
+    await update_flakiness(class_results, session)
+    await upsert_class_results(class_results, session)
+    if commit:
+        await session.commit()
+        readcache.invalidate(class_results)
+    observe_stage('db_commit', time.perf_counter() - start, len(class_results))
+
+async def fold_records(class_results, filename: str, records: AsyncIterable[Dict[str, Any]]) -> int:
+    """Fold the records of one file into the accumulator and return how many there were."""
+    record_count = 0
+    async for record in records:
+        add_test_info(class_results, process_test_file(record), filename)
+        record_count += 1
+    return record_count
+
+async def ingest_build(
+        uploads: AsyncIterable[Tuple[str, AsyncIterable[Dict[str, Any]]]],
+        session: AsyncSession,
+        build_id: Optional[str] = None,
+        final: bool = True,
+        commit: bool = True
+        ) -> List[Dict[str, Any]]:
+    """Aggregate every uploaded file per class, then analyze and store the build once.
+
+    `uploads` asynchronously yields `(filename, records)` pairs, one per
+    uploaded file or archive member. Records are folded into the
+    accumulator one at a time as they are decoded, so raw files are never
+    held in memory. A file that fails to parse is left out of the build;
+    the returned per-file outcomes report it instead of raising, so callers
+    handling many files (the upload route and the job worker) can report
+    each one. Failures to analyze or store the build are not per-file
+    problems: the transaction is rolled back and the error is raised, so
+    the upload can be retried.
+    """
+    class_results = new_class_results()
+    outcomes = []
+    start = time.perf_counter()
+    async for filename, records in uploads:
+        file_results = new_class_results()
+        try:
+            record_count = await fold_records(file_results, filename, records)
+        except Exception as e:
+            print(f"Error processing {filename}: {str(e)}")
+            outcomes.append({
+                'file': filename,
+                'status': 'error',
+                'error': str(e)
+            })
+            continue
+        merge_class_results(class_results, file_results)
+        outcomes.append({
+            'file': filename,
+            'status': 'ok',
+            'records': record_count,
+            'classes': sorted(file_results)
+        })
+    observe_stage('parse', time.perf_counter() - start, len(class_results))
+    UPLOAD_RECORDS.observe(sum(outcome.get('records', 0) for outcome in outcomes))
+
+    try:
+        await store_build_results(class_results, session, build_id, final, commit)
+    except Exception as e:
+        print(f"Error storing results: {str(e)}")
+        await session.rollback()
+        raise
+    return outcomes
+
+async def ingest_files(
+        files: List[Tuple[str, AsyncIterable[Tuple[str, AsyncIterable[Dict[str, Any]]]]]],
+        session: AsyncSession,
+        build_id: Optional[str] = None,
+        final: bool = True,
+        commit: bool = True
+        ) -> List[Dict[str, Any]]:
+    """ingest_build over uploaded files, reporting one outcome per file.
+
+    `files` holds `(filename, uploads)` pairs, where `uploads` yields the
+    `(filename, records)` pairs of that file: the file itself, or each
+    member of an archive. An archive's member outcomes are combined by
+    archive_outcome, so an archive without result members is reported too.
+    """
+    sources = []
+
+    async def streams():
+        for index, (_, uploads) in enumerate(files):
+            async for upload in uploads:
+                sources.append(index)
+                yield upload
+
+    outcomes = await ingest_build(streams(), session, build_id, final, commit)
+    grouped = [[] for _ in files]
+    for index, outcome in zip(sources, outcomes):
+        grouped[index].append(outcome)
+    return [
+        archive_outcome(filename, file_outcomes) if is_archive(filename) else file_outcomes[0]
+        for (filename, _), file_outcomes in zip(files, grouped)
+    ]
+
+async def _afail(error: Exception):
+    raise error
+    yield
+
+async def _athread(iterator: Iterator, batch_size: int = ARCHIVE_RECORD_BATCH):
+    """Drain a blocking iterator in worker threads, a batch at a time."""
+    while True:
+        batch = await asyncio.to_thread(lambda: list(islice(iterator, batch_size)))
+        if not batch:
+            return
+        for item in batch:
+            yield item
+
+async def archive_records(fileobj, filename: str):
+    """Yield `(filename, records)` for each result member of a .zip or .tar.gz upload.
+
+    Decompressing and decoding block, so the archive is read in worker
+    threads. Each member's records are streamed while the member is open,
+    a batch at a time, so memory does not grow with the member size. A
+    member that fails to decode is reported on its own; a corrupt archive
+    is reported as a failure of the archive itself.
+    """
+    members = iter_archive_members(fileobj, filename)
+    while True:
+        try:
+            member = await asyncio.to_thread(next, members, None)
+        except Exception as e:
+            yield filename, _afail(e)
+            return
+        if member is None:
+            return
+        name, size, member_file = member
+        UPLOAD_BYTES.observe(size)
+        yield f"{filename}/{name}", _athread(iter_file_records(member_file))
+
+def archive_outcome(filename: str, member_outcomes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One outcome for an uploaded archive, from the outcomes of its members.
+
+    A corrupt archive reports a single outcome under its own name, which is
+    returned as is.
+    """
+    if len(member_outcomes) == 1 and member_outcomes[0]['file'] == filename:
+        return member_outcomes[0]
+    outcome = {
+        'file': filename,
+        'status': 'ok',
+        'records': sum(member.get('records', 0) for member in member_outcomes),
+        'members': member_outcomes
+    }
+    errors = [member for member in member_outcomes if member['status'] != 'ok']
+    if errors:
+        outcome['status'] = 'error'
+        outcome['error'] = f"{len(errors)} of {len(member_outcomes)} members failed"
+    elif not member_outcomes:
+        outcome['status'] = 'error'
+        outcome['error'] = "No members match UPLOAD_ARCHIVE_MEMBER_PATTERNS"
+    return outcome
+
+async def upload_records(files: List[UploadFile]):
+    for file in files:
+        if is_archive(file.filename):
+            async for member in archive_records(file.file, file.filename):
+                yield member
+        else:
+            yield file.filename, aiter_upload_records(file)
+
+async def stored_records(files: Iterable[Tuple[str, AsyncIterable[bytes]]]):
+    """Yield `(filename, records)` for queued uploads given as `(filename, chunks)`.
+
+    Plain files are decoded as their chunks arrive. An archive is spooled
+    to a temporary file first (kept in memory up to UPLOAD_STORE_CHUNK_BYTES),
+    since a .zip can only be read with seeks.
+    """
+    for filename, chunks in files:
+        if not is_archive(filename):
+            yield filename, aiter_chunk_records(chunks)
+            continue
+        with tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_STORE_CHUNK_BYTES) as spool:
+            async for chunk in chunks:
+                await asyncio.to_thread(spool.write, chunk)
+            spool.seek(0)
+            async for member in archive_records(spool, filename):
+                yield member
@@ -0,0 +1,119 @@
+"""Analysis backends: where prompts for failure analysis are sent.
+
+ANALYSIS_BACKEND selects one per process:
+
+- ``gemini``: the live Gemini model (needs GOOGLE_API_KEY)
+- ``stub``: a deterministic local answer after ANALYSIS_STUB_LATENCY_SECONDS,
+  for load tests and CI without network access or quota
+- ``record``: Gemini, saving every response under ANALYSIS_RECORD_DIR
+- ``replay``: serve the responses saved by ``record``; unknown prompts raise
+
+Everything except the model itself is then reproducible offline.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from app.core.config import settings, get_model
+
+class AnalysisBackend(ABC):
+    """Turns a prompt into the raw response text of the model."""
+
+    needs_api_key = False
+
+    @abstractmethod
+    def generate(self, prompt: str) -> str:
+        ...
+
+class GeminiBackend(AnalysisBackend):
+    needs_api_key = True
+
+    def generate(self, prompt: str) -> str:
+        return get_model().generate_content(prompt).text
+
+class StubBackend(AnalysisBackend):
+    """Answers every prompt with the same JSON, derived from the prompt digest.
+
+    The answer carries both the service fields (causes/solutions) and the CLI
+    fields (possible_cause/possible_fix), so either parser accepts it.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        digest = prompt_digest(prompt)[:12]
+        return json.dumps({
+            "causes": [{
+                "cause": f"Stub cause {digest}",
+                "confidence": "low",
+                "technical_details": "Generated by the stub analysis backend"
+            }],
+            "solutions": [{
+                "solution": f"Stub solution {digest}",
+                "priority": "low",
+                "implementation_steps": ["Re-run with ANALYSIS_BACKEND=gemini for a real analysis"]
+            }],
+            "possible_cause": f"Stub cause {digest}",
+            "possible_fix": f"Stub solution {digest}"
+        })
+
+class RecordReplayBackend(AnalysisBackend):
+    """Stores responses as ``<sha256 of prompt>.json`` files in `directory`.
+
+    When `upstream` is given, each prompt is sent there and the response is
+    recorded; without it, responses are only replayed and a prompt that was
+    never recorded raises LookupError.
+    """
+
+    def __init__(self, directory: str, upstream: AnalysisBackend = None):
+        self.directory = directory
+        self.upstream = upstream
+        self.needs_api_key = upstream is not None and upstream.needs_api_key
+
+    def _path(self, prompt: str) -> str:
+        return os.path.join(self.directory, f"{prompt_digest(prompt)}.json")
+
+    def generate(self, prompt: str) -> str:
+        path = self._path(prompt)
+        if self.upstream is None:
+            try:
+                with open(path) as f:
+                    return json.load(f)["response"]
+            except FileNotFoundError:
+                raise LookupError(f"No recorded response for prompt {os.path.basename(path)}")
+
+        response = self.upstream.generate(prompt)
+        os.makedirs(self.directory, exist_ok=True)
+        # Write then rename, so concurrent replays never see a partial file
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({"prompt": prompt, "response": response}, f)
+        os.replace(temporary, path)
+        return response
+
+def prompt_digest(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+@lru_cache()
+def get_backend() -> AnalysisBackend:
+    """The analysis backend configured for this process."""
+    name = settings.ANALYSIS_BACKEND.lower()
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "stub":
+        return StubBackend(settings.ANALYSIS_STUB_LATENCY_SECONDS)
+    if name == "record":
+        return RecordReplayBackend(settings.ANALYSIS_RECORD_DIR, GeminiBackend())
+    if name == "replay":
+        return RecordReplayBackend(settings.ANALYSIS_RECORD_DIR)
+    raise ValueError(f"Unknown ANALYSIS_BACKEND {settings.ANALYSIS_BACKEND!r}; expected gemini, stub, record or replay")
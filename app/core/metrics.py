@@ -0,0 +1,97 @@
+"""Prometheus metrics for the ingestion pipeline.
+
+Everything here is a process-local counter or histogram update, cheap
+enough to leave on in production. The API serves them at ``/metrics``;
+workers expose their own registry on WORKER_METRICS_PORT.
+"""
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Histogram
+
+# Buckets from 1ms to ~10 minutes; uploads with LLM analysis can be slow
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600
+)
+SIZE_BUCKETS = tuple(2 ** exponent for exponent in range(10, 31, 2))  # 1 KiB .. 1 GiB
+
+UPLOAD_STAGE_SECONDS = Histogram(
+    "jds_upload_stage_seconds",
+    "Time spent per upload in each ingestion stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+CLASS_STAGE_SECONDS = Histogram(
+    "jds_class_stage_seconds",
+    "Time per test class in each ingestion stage (upload stage time divided by its class count)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+UPLOAD_BYTES = Histogram(
+    "jds_upload_file_bytes",
+    "Size of each uploaded result file",
+    buckets=SIZE_BUCKETS,
+)
+UPLOAD_RECORDS = Histogram(
+    "jds_upload_records",
+    "Test records per upload",
+    buckets=(1, 10, 100, 1000, 10000, 100000, 1000000),
+)
+LLM_REQUESTS = Counter(
+    "jds_llm_requests_total",
+    "Model analysis requests by outcome",
+    ["outcome"],
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "jds_llm_request_seconds",
+    "Latency of model analysis requests",
+    buckets=LATENCY_BUCKETS,
+)
+ANALYSIS_CACHE_LOOKUPS = Counter(
+    "jds_analysis_cache_lookups_total",
+    "Failure-signature cache lookups by result",
+    ["result"],
+)
+SIMILARITY_LOOKUPS = Counter(
+    "jds_similarity_lookups_total",
+    "Nearest-past-failure lookups by result (hit: answered without the model)",
+    ["result"],
+)
+READ_CACHE_LOOKUPS = Counter(
+    "jds_read_cache_lookups_total",
+    "Class reads by result: not_modified (304 without the database), hit, or miss",
+    ["result"],
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "jds_db_pool_checkout_seconds",
+    "Time to check a connection out of the engine pool, including pre-ping",
+    ["engine"],
+    buckets=LATENCY_BUCKETS,
+)
+
+def observe_stage(stage: str, seconds: float, class_count: int = 0):
+    """Record an upload stage, and its per-class share when the upload had classes."""
+    UPLOAD_STAGE_SECONDS.labels(stage).observe(seconds)
+    if class_count:
+        CLASS_STAGE_SECONDS.labels(stage).observe(seconds / class_count)
+
+@contextmanager
+def timed_llm_request():
+    """Time a model call and count it as 'ok' or, if it raises, 'error'."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        LLM_REQUESTS.labels('error').inc()
+        raise
+    else:
+        LLM_REQUESTS.labels('ok').inc()
+    finally:
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - start)
+
+@contextmanager
+def timed_checkout(engine: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        DB_POOL_CHECKOUT_SECONDS.labels(engine).observe(time.perf_counter() - start)
@@ -0,0 +1,88 @@
+"""Builds the model input for a class from its failure details.
+
+Failures of one class tend to repeat the same message and trace and are
+dominated by test-framework frames. Before anything is sent to the model,
+messages and traces are deduplicated, framework frames are dropped,
+repeated frames are collapsed and the result is fitted to
+PROMPT_TOKEN_BUDGET.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+from app.core.config import settings
+from app.core.frames import parse_frame_line
+
+# Tokens reserved for the instructions and JSON schema around the failure
+PROMPT_OVERHEAD_TOKENS = 300
+# Below this many characters a trace is not worth including at all
+MIN_TRACE_CHARS = 400
+
+def _unique(values: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(value for value in values if value))
+
+def _is_excluded(line: str, excluded_packages: List[str]) -> bool:
+    frame = parse_frame_line(line)
+    if frame is None or not frame['method']:
+        return False
+    # Drop the JPMS module prefix, e.g. java.base/jdk.internal.reflect...
+    method = frame['method'].rsplit('/', 1)[-1]
+    return method.startswith(tuple(excluded_packages))
+
+def clean_trace(trace: str, excluded_packages: Optional[List[str]] = None) -> str:
+    """Drop framework frames and collapse runs of identical lines."""
+    if excluded_packages is None:
+        excluded_packages = settings.PROMPT_EXCLUDED_PACKAGES
+    lines = []
+    previous = None
+    repeats = 0
+    dropped = 0
+    for line in trace.splitlines():
+        if excluded_packages and _is_excluded(line, excluded_packages):
+            dropped += 1
+            continue
+        if line == previous:
+            repeats += 1
+            continue
+        if repeats:
+            lines.append(f"    ... (previous line repeated {repeats} more times)")
+            repeats = 0
+        lines.append(line)
+        previous = line
+    if repeats:
+        lines.append(f"    ... (previous line repeated {repeats} more times)")
+    if dropped:
+        lines.append(f"    ... ({dropped} framework frames omitted)")
+    return '\n'.join(lines)
+
+def _truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind('\n', 0, max_chars)
+    if cut <= 0:
+        cut = max_chars
+    omitted = text[cut:].lstrip('\n').count('\n') + 1
+    return text[:cut] + f"\n    ... ({omitted} lines trimmed to fit the prompt budget)"
+
+def build_failure_input(failure_details: List[Dict[str, Any]], token_budget: Optional[int] = None) -> Dict[str, str]:
+    """Combine a class's failures into one deduplicated, budgeted message/trace pair."""
+    if token_budget is None:
+        token_budget = settings.PROMPT_TOKEN_BUDGET
+    budget_chars = max(token_budget - PROMPT_OVERHEAD_TOKENS, 0) * 4
+
+    messages = _unique(f.get('message') for f in failure_details)
+    traces = _unique(clean_trace(trace) for trace in _unique(f.get('trace') for f in failure_details))
+
+    # Messages get at most half of the budget; traces share what is left
+    message = _truncate('\n'.join(messages), budget_chars // 2)
+    trace_chars = budget_chars - len(message)
+
+    kept = traces
+    while kept and trace_chars // len(kept) < MIN_TRACE_CHARS and len(kept) > 1:
+        kept = kept[:-1]
+    per_trace = trace_chars // len(kept) if kept else 0
+    parts = [_truncate(trace, per_trace) for trace in kept]
+    if len(kept) < len(traces):
+        parts.append(f"... ({len(traces) - len(kept)} more distinct traces omitted)")
+
+    return {
+        'message': message,
+        'trace': '\n\n'.join(parts)
+    }
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+import time
+from functools import lru_cache
+from app.core.config import settings
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens per minute.
+
+    Reservations may drive the balance negative; the caller then waits until
+    the debt is repaid. This keeps callers in arrival order without a queue
+    and lets sync and async callers share one bucket.
+    """
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        """Take `amount` tokens and return how many seconds to wait before using them."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+class ModelRateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for one model quota."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    def _reserve(self, tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def acquire(self, tokens: int = 0):
+        wait = self._reserve(tokens)
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0):
+        wait = self._reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for quota accounting."""
+    return len(text) // 4 + 1
+
+@lru_cache()
+def get_rate_limiter():
+    return ModelRateLimiter(settings.LLM_RPM, settings.LLM_TPM)
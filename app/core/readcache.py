@@ -0,0 +1,108 @@
+"""In-process cache of class read responses, keyed by test name and version.
+
+A class only changes when an upload bumps ``test_results.version``, so a
+rendered response stays valid for as long as its version is current. Two
+bounded LRUs are kept:
+
+- the current version of each recently read class, trusted for
+  READ_CACHE_TTL_SECONDS; it answers If-None-Match without touching the
+  database
+- rendered response bodies per (test name, version, resource)
+
+Uploads in this process invalidate the classes they wrote right after
+commit; a read that started before that invalidation is not cached, so it
+cannot bring the old version back. Uploads handled by other processes
+(other API replicas, the worker) become visible once the TTL expires.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import READ_CACHE_LOOKUPS
+
+_lock = threading.Lock()
+_versions: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+_bodies: "OrderedDict[Tuple[str, int, str], bytes]" = OrderedDict()
+# Invalidation generation: bumped by every invalidate(), remembered per
+# class; classes pushed out of _invalidated count as invalidated at _forgotten
+_generation = 0
+_invalidated: "OrderedDict[str, int]" = OrderedDict()
+_forgotten = 0
+
+def make_etag(version: int) -> str:
+    return f'"{version}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers `etag` (weak comparison, as for GET)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+def current_version(test_name: str) -> Optional[int]:
+    """The version last seen for `test_name`, if it is still trusted."""
+    if settings.READ_CACHE_TTL_SECONDS <= 0:
+        return None
+    with _lock:
+        entry = _versions.get(test_name)
+        if entry is None:
+            return None
+        version, expires_at = entry
+        if expires_at < time.monotonic():
+            del _versions[test_name]
+            return None
+        _versions.move_to_end(test_name)
+        return version
+
+def get_body(test_name: str, version: int, resource: str) -> Optional[bytes]:
+    with _lock:
+        body = _bodies.get((test_name, version, resource))
+        if body is not None:
+            _bodies.move_to_end((test_name, version, resource))
+        return body
+
+def read_started() -> int:
+    """Token to take before reading a class from the database, for put()."""
+    with _lock:
+        return _generation
+
+def put(test_name: str, version: int, resource: str, body: bytes, started: int):
+    """Remember a freshly read version and its rendered body.
+
+    Skipped when the class was invalidated after `started` (from
+    read_started()), as the read may have returned the version just replaced.
+    """
+    if settings.READ_CACHE_TTL_SECONDS <= 0:
+        return
+    with _lock:
+        if _invalidated.get(test_name, _forgotten) > started:
+            return
+        _versions[test_name] = (version, time.monotonic() + settings.READ_CACHE_TTL_SECONDS)
+        _versions.move_to_end(test_name)
+        _bodies[(test_name, version, resource)] = body
+        _bodies.move_to_end((test_name, version, resource))
+        while len(_versions) > settings.READ_CACHE_SIZE:
+            _versions.popitem(last=False)
+        while len(_bodies) > settings.READ_CACHE_SIZE:
+            _bodies.popitem(last=False)
+
+def invalidate(test_names: Iterable[str]):
+    """Forget the versions of classes an upload just wrote.
+
+    Their cached bodies are left to age out of the LRU: they are keyed by
+    the old version and can no longer be served once the version is gone.
+    """
+    global _generation, _forgotten
+    with _lock:
+        _generation += 1
+        for test_name in test_names:
+            _versions.pop(test_name, None)
+            _invalidated[test_name] = _generation
+            _invalidated.move_to_end(test_name)
+        while len(_invalidated) > settings.READ_CACHE_SIZE:
+            _forgotten = max(_forgotten, _invalidated.popitem(last=False)[1])
+
+def record_lookup(result: str):
+    READ_CACHE_LOOKUPS.labels(result).inc()
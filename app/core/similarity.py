@@ -0,0 +1,225 @@
+"""Nearest-neighbour retrieval of past failures and their analyses.
+
+Every analyzed class is indexed as a hashed-feature vector of its failure:
+the normalized message words, the root-cause exception type and the top
+non-framework frames. Vectors are L2-normalized rows of one NumPy matrix,
+so a lookup is a single matrix-vector product (cosine similarity).
+
+The index is filled from the ``test_results.analysis`` of recently updated
+classes at startup (or on first use) and then updated in place as new
+analyses are produced. When a new failure is
+at least SIMILARITY_THRESHOLD similar to past ones, their causes and
+solutions are returned instead of asking the model.
+"""
+import hashlib
+import math
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from datetime import timedelta
+from sqlalchemy import select
+from app.core.cache import normalize_failure_text
+from app.core.cluster import exception_type, top_frames
+from app.core.config import settings, logger
+from app.core.metrics import SIMILARITY_LOOKUPS
+from app.core.traces import load_traces
+from app.db.init_db import AsyncSessionLocal
+from app.models import TestResult, utcnow_sql
+
+# Root-cause frames included in the features
+FEATURE_FRAMES = 5
+# Relative weights: the exception type and frames say more than any one word
+EXCEPTION_WEIGHT = 3.0
+FRAME_WEIGHT = 2.0
+
+_WORD_RE = re.compile(r'[A-Za-z_$][\w$]+')
+
+def _features(failure_input: Dict[str, str]) -> Dict[str, float]:
+    message = failure_input.get('message') or ''
+    trace = failure_input.get('trace') or ''
+    features: Dict[str, float] = {}
+    for word in _WORD_RE.findall(normalize_failure_text(message).lower()):
+        features['w:' + word] = features.get('w:' + word, 0.0) + 1.0
+    # Sublinear term frequency, so a repeated word cannot dominate
+    features = {name: 1.0 + math.log(count) for name, count in features.items()}
+    exception = exception_type(message, trace)
+    if exception:
+        features['e:' + exception] = EXCEPTION_WEIGHT
+    for frame in top_frames(trace, FEATURE_FRAMES):
+        features['f:' + frame] = FRAME_WEIGHT
+    return features
+
+def failure_vector(failure_input: Dict[str, str], dimensions: int) -> np.ndarray:
+    """L2-normalized hashed-feature vector of a failure; all zeros if it has no features."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for name, weight in _features(failure_input).items():
+        value = int.from_bytes(hashlib.blake2b(name.encode('utf-8'), digest_size=8).digest(), 'big')
+        # The lowest bit picks the sign, so hash collisions tend to cancel out
+        vector[(value >> 1) % dimensions] += weight if value & 1 else -weight
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+def _is_fallback(analysis: Dict[str, Any]) -> bool:
+    # As produced by app.core.utils.fallback_analysis when the model failed
+    causes = analysis.get('causes') or []
+    return not causes or causes[0].get('cause') == "Error analyzing failures"
+
+class SimilarityIndex:
+    """Past failures as rows of a float32 matrix, keyed by class name."""
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+        self.loaded = False
+        self._loading = False
+        self._matrix = np.zeros((0, dimensions), dtype=np.float32)
+        self._count = 0
+        self._keys: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._analyses: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def add(self, keys: Iterable[str], failure_input: Dict[str, str], analysis: Dict[str, Any]):
+        """Index (or re-index) the classes in `keys`, which share one failure and analysis."""
+        if not analysis or _is_fallback(analysis):
+            return
+        vector = failure_vector(failure_input, self.dimensions)
+        if not vector.any():
+            return
+        with self._lock:
+            for key in keys:
+                row = self._rows.get(key)
+                if row is None:
+                    if self._count == len(self._matrix):
+                        # Amortized growth; rows past _count are unused
+                        grown = np.zeros((max(64, 2 * len(self._matrix)), self.dimensions), dtype=np.float32)
+                        grown[:self._count] = self._matrix[:self._count]
+                        self._matrix = grown
+                    row = self._rows[key] = self._count
+                    self._count += 1
+                    self._keys.append(key)
+                    self._analyses.append(analysis)
+                self._matrix[row] = vector
+                self._analyses[row] = analysis
+
+    def nearest(self, failure_input: Dict[str, str], k: int) -> List[Tuple[float, str, Dict[str, Any]]]:
+        """The `k` most similar indexed failures as (cosine similarity, class name, analysis), best first."""
+        vector = failure_vector(failure_input, self.dimensions)
+        with self._lock:
+            if not self._count or k <= 0 or not vector.any():
+                return []
+            scores = self._matrix[:self._count] @ vector
+            k = min(k, self._count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(float(scores[row]), self._keys[row], self._analyses[row]) for row in top]
+
+    def known_analysis(self, failure_input: Dict[str, str], threshold: Optional[float] = None, k: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Causes and solutions of the past failures at least `threshold` similar, or None.
+
+        The neighbours' causes and solutions are merged best-first without
+        duplicates, and listed under ``similar_failures``.
+        """
+        if threshold is None:
+            threshold = settings.SIMILARITY_THRESHOLD
+        if k is None:
+            k = settings.SIMILARITY_TOP_K
+        if threshold > 1:
+            return None
+        matches = [match for match in self.nearest(failure_input, k) if match[0] >= threshold]
+        if not matches:
+            SIMILARITY_LOOKUPS.labels('miss').inc()
+            return None
+        SIMILARITY_LOOKUPS.labels('hit').inc()
+
+        causes, solutions = {}, {}
+        for _, _, analysis in matches:
+            for cause in analysis.get('causes', []):
+                causes.setdefault(cause.get('cause'), cause)
+            for solution in analysis.get('solutions', []):
+                solutions.setdefault(solution.get('solution'), solution)
+        return {
+            'causes': list(causes.values()),
+            'solutions': list(solutions.values()),
+            'similar_failures': [
+                {'test_name': key, 'similarity': round(score, 3)}
+                for score, key, _ in matches
+            ]
+        }
+
+    def _load_rows(self, rows, traces: Dict[str, str]):
+        count = 0
+        for test_name, failure_details, analysis in rows:
+            if failure_details and analysis:
+                self.add([test_name], stored_failure_input(failure_details, traces), analysis)
+                count += 1
+        self.loaded = True
+        logger.info(f"Similarity index loaded {count} past failures")
+
+    async def ensure_loaded_async(self):
+        """Fill the index from recent test_results once per process, in its own short session.
+
+        Called at startup by the API and workers and again by uploads until
+        it succeeds; uploads arriving while it loads carry on without it.
+        """
+        if self.loaded or self._loading:
+            return
+        self._loading = True
+        try:
+            async with AsyncSessionLocal() as session:
+                rows = (await session.execute(_history_query())).all()
+                traces = await load_traces(_feature_trace_hashes(rows), session)
+            self._load_rows(rows, traces)
+        except Exception as e:
+            logger.warning(f"Similarity index load failed: {e}")
+        finally:
+            self._loading = False
+
+def _feature_trace(failure_details: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    # The first failure with a trace, stored inline (older rows) or by hash
+    return next((f for f in failure_details if f.get('trace') or f.get('trace_hash')), None)
+
+def _feature_trace_hashes(rows) -> List[str]:
+    hashes = []
+    for _, failure_details, analysis in rows:
+        failure = _feature_trace(failure_details or []) if analysis else None
+        if failure and not failure.get('trace'):
+            hashes.append(failure['trace_hash'])
+    return hashes
+
+def stored_failure_input(failure_details: List[Dict[str, Any]], traces: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Enough of a stored class's failures for its features, without building a prompt.
+
+    Only the messages and the first trace contribute features, so the
+    prompt-sized input of build_failure_input is not needed at load time,
+    and only that one trace per class is fetched from trace_blobs
+    (`traces`, by hash).
+    """
+    messages = dict.fromkeys(f.get('message') for f in failure_details if f.get('message'))
+    failure = _feature_trace(failure_details) or {}
+    trace = failure.get('trace') or (traces or {}).get(failure.get('trace_hash'), '')
+    return {'message': '\n'.join(messages), 'trace': trace}
+
+def _history_query():
+    # Only recently updated classes, newest first, up to SIMILARITY_MAX_INDEXED
+    return (
+        select(TestResult.test_name, TestResult.failure_details, TestResult.analysis)
+        .where(
+            TestResult.is_active.is_(True),
+            TestResult.analysis.isnot(None),
+            TestResult.fail_percentage > 0,
+            TestResult.last_updated >= utcnow_sql() - timedelta(days=settings.SIMILARITY_HISTORY_DAYS)
+        )
+        .order_by(TestResult.last_updated.desc())
+        .limit(settings.SIMILARITY_MAX_INDEXED)
+    )
+
+@lru_cache()
+def get_similarity_index() -> SimilarityIndex:
+    return SimilarityIndex(settings.SIMILARITY_DIMENSIONS)
@@ -0,0 +1,155 @@
+import codecs
+import fnmatch
+import json
+import posixpath
+import re
+import tarfile
+import zipfile
+from typing import Any, AsyncIterable, AsyncIterator, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+from fastapi import UploadFile
+from app.core.config import settings
+from app.core.metrics import UPLOAD_BYTES
+
+# Allowed between records: whitespace and NDJSON newlines, plus commas
+# inside a top-level JSON array.
+_WHITESPACE = re.compile(r'\s*')
+_ARRAY_SEPARATORS = re.compile(r'[\s,]*')
+
+class RecordDecoder:
+    """Incremental decoder for a byte stream of JSON test records.
+
+    Accepts a single result object, a top-level array of objects, or
+    concatenated / newline-delimited objects, and hands back each record as
+    soon as it is complete. Only the record currently being received is
+    buffered; if it grows beyond `max_buffer_bytes` decoding is aborted.
+    A stream that ends inside an array (no closing ``]``) was truncated and
+    is rejected.
+    """
+
+    def __init__(self, max_buffer_bytes: int = None):
+        self.max_buffer_bytes = max_buffer_bytes or settings.UPLOAD_MAX_BUFFER_BYTES
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._in_array = False
+        # A failed decode of a partial record is only retried once the
+        # pending text has doubled, keeping large records linear to parse.
+        self._retry_at = 0
+
+    def feed(self, chunk: bytes) -> List[Dict[str, Any]]:
+        self._buffer += self._utf8.decode(chunk)
+        return self._drain(final=False)
+
+    def close(self) -> List[Dict[str, Any]]:
+        self._buffer += self._utf8.decode(b'', final=True)
+        records = self._drain(final=True)
+        if self._in_array:
+            raise ValueError("Upload ends inside a JSON array (missing ']'); it was probably truncated")
+        return records
+
+    def _drain(self, final: bool) -> List[Dict[str, Any]]:
+        records = []
+        buffer = self._buffer
+        pos = 0
+        while True:
+            pos = (_ARRAY_SEPARATORS if self._in_array else _WHITESPACE).match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            # A top-level array opens once and must be closed before the end
+            if buffer[pos] == '[' and not self._in_array:
+                self._in_array = True
+                pos += 1
+                continue
+            if buffer[pos] == ']' and self._in_array:
+                self._in_array = False
+                pos += 1
+                continue
+            if not final and len(buffer) - pos < self._retry_at:
+                break
+            if buffer[pos] != '{':
+                raise ValueError(f"Expected a JSON object at offset {pos}, found {buffer[pos]!r}")
+            try:
+                record, pos = self._json.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                self._retry_at = 2 * (len(buffer) - pos)
+                break
+            self._retry_at = 0
+            records.append(record)
+
+        self._buffer = buffer[pos:]
+        if len(self._buffer) > self.max_buffer_bytes:
+            raise ValueError(
+                f"Test record exceeds UPLOAD_MAX_BUFFER_BYTES ({self.max_buffer_bytes} bytes)"
+            )
+        return records
+
+def iter_records(chunks: Iterable[bytes], max_buffer_bytes: int = None) -> Iterator[Dict[str, Any]]:
+    """Yield test records from an iterable of byte chunks."""
+    decoder = RecordDecoder(max_buffer_bytes)
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
+
+def iter_file_records(fileobj, chunk_size: int = None, max_buffer_bytes: int = None) -> Iterator[Dict[str, Any]]:
+    """Yield test records from a binary file object, reading it in chunks."""
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    return iter_records(iter(lambda: fileobj.read(chunk_size), b''), max_buffer_bytes)
+
+async def aiter_chunk_records(chunks: AsyncIterable[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """Yield test records from an async iterable of byte chunks as they arrive."""
+    decoder = RecordDecoder()
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        for record in decoder.feed(chunk):
+            yield record
+    UPLOAD_BYTES.observe(size)
+    for record in decoder.close():
+        yield record
+
+async def aiter_upload_chunks(file: UploadFile, chunk_size: int = None) -> AsyncIterator[bytes]:
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def aiter_upload_records(file: UploadFile, chunk_size: int = None) -> AsyncIterator[Dict[str, Any]]:
+    """Yield test records from an upload without reading it into memory at once."""
+    return aiter_chunk_records(aiter_upload_chunks(file, chunk_size))
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar.gz', '.tgz')
+
+def is_archive(filename: Optional[str]) -> bool:
+    return (filename or '').lower().endswith(ARCHIVE_SUFFIXES)
+
+def _member_matches(name: str, patterns: List[str]) -> bool:
+    basename = posixpath.basename(name)
+    return any(fnmatch.fnmatchcase(basename, pattern) for pattern in patterns)
+
+def iter_archive_members(fileobj: BinaryIO, filename: str, patterns: List[str] = None) -> Iterator[Tuple[str, int, BinaryIO]]:
+    """Yield (name, size, file object) for the result members of a .zip or .tar.gz archive.
+
+    Members are decompressed as they are read and never extracted to disk.
+    Only regular files whose base name matches one of `patterns` (by
+    default UPLOAD_ARCHIVE_MEMBER_PATTERNS) are yielded, so attachments are
+    skipped without being decompressed. A .zip must be seekable; a .tar.gz
+    is read front to back as a stream. Each member's file object is only
+    valid until the next one is requested.
+    """
+    if patterns is None:
+        patterns = settings.UPLOAD_ARCHIVE_MEMBER_PATTERNS
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _member_matches(info.filename, patterns):
+                    with archive.open(info) as member:
+                        yield info.filename, info.file_size, member
+    else:
+        with tarfile.open(fileobj=fileobj, mode='r|gz') as archive:
+            for info in archive:
+                if info.isfile() and _member_matches(info.name, patterns):
+                    yield info.name, info.size, archive.extractfile(info)
@@ -0,0 +1,94 @@
+"""Content-addressed, compressed storage of stack traces.
+
+The same trace is typically reported by many tests, classes and builds.
+Instead of copying the text into every ``failure_details`` entry and
+``test_case_results`` row, each distinct trace is written once to
+``trace_blobs`` (zlib-compressed, keyed by its sha256) and referenced by
+``trace_hash``. Reads decompress only the traces they return.
+"""
+import hashlib
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
+from app.core.config import settings
+from app.models import TraceBlob
+
+def trace_hash(trace: str) -> str:
+    return hashlib.sha256(trace.encode('utf-8')).hexdigest()
+
+def compress_trace(trace: str) -> bytes:
+    return zlib.compress(trace.encode('utf-8'), settings.TRACE_COMPRESSION_LEVEL)
+
+def decompress_trace(data: bytes) -> str:
+    return zlib.decompress(data).decode('utf-8')
+
+def collect_traces(class_results) -> Dict[str, str]:
+    """Distinct traces of the failures and test cases of an accumulator, by hash."""
+    traces = {}
+    for result in class_results.values():
+        for item in (*result['failure_details'], *result['cases']):
+            trace = item.get('trace')
+            if trace:
+                traces.setdefault(trace_hash(trace), trace)
+    return traces
+
+def externalize_traces(items: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Copies of `items` with ``trace`` replaced by ``trace_hash``."""
+    externalized = []
+    for item in items:
+        item = dict(item)
+        trace = item.pop('trace', None)
+        item['trace_hash'] = trace_hash(trace) if trace else None
+        externalized.append(item)
+    return externalized
+
+async def store_traces(traces: Dict[str, str], session: AsyncSession):
+    """Insert the traces not stored yet. Nothing is committed here.
+
+    Rows are inserted in hash order, so concurrent uploads sharing traces
+    take their row locks in the same order and cannot deadlock.
+    """
+    rows = [
+        {'hash': key, 'data': compress_trace(trace), 'size': len(trace.encode('utf-8'))}
+        for key, trace in sorted(traces.items())
+    ]
+    for start in range(0, len(rows), settings.UPSERT_BATCH_SIZE):
+        stmt = insert(TraceBlob).values(rows[start:start + settings.UPSERT_BATCH_SIZE])
+        await session.execute(stmt.on_conflict_do_nothing(index_elements=[TraceBlob.hash]))
+
+def _trace_batches(hashes: Iterable[Optional[str]]):
+    hashes = sorted({key for key in hashes if key})
+    for start in range(0, len(hashes), settings.UPSERT_BATCH_SIZE):
+        yield select(TraceBlob.hash, TraceBlob.data).where(
+            TraceBlob.hash.in_(hashes[start:start + settings.UPSERT_BATCH_SIZE])
+        )
+
+async def load_traces(hashes: Iterable[Optional[str]], session: AsyncSession) -> Dict[str, str]:
+    """Decompressed traces by hash; unknown hashes are left out."""
+    traces = {}
+    for query in _trace_batches(hashes):
+        for key, data in await session.execute(query):
+            traces[key] = decompress_trace(data)
+    return traces
+
+def with_traces(failure_details: Optional[List[Dict[str, Any]]], traces: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    """Copies of `failure_details` with ``trace`` filled in from `traces`.
+
+    Entries written before trace_blobs still embed their trace and are
+    returned unchanged.
+    """
+    if not failure_details:
+        return failure_details
+    return [
+        dict(failure, trace=traces.get(failure['trace_hash'])) if failure.get('trace_hash') and 'trace' not in failure else failure
+        for failure in failure_details
+    ]
+
+async def resolve_traces(failure_details: Optional[List[Dict[str, Any]]], session: AsyncSession) -> Optional[List[Dict[str, Any]]]:
+    """Failure details with their traces loaded and decompressed."""
+    if not failure_details:
+        return failure_details
+    traces = await load_traces((failure.get('trace_hash') for failure in failure_details), session)
+    return with_traces(failure_details, traces)
@@ -1,10 +1,18 @@
 import json
-import time
-from app.core.config import get_model
+import asyncio
+from app.core.config import settings
+from app.core.llm import get_backend
+from app.core.ratelimit import get_rate_limiter, estimate_tokens
+from app.core.metrics import timed_llm_request
+from app.core.frames import first_frame
+from app.core.cluster import cluster_failures
+from app.core.similarity import get_similarity_index
+from app.core.cache import failure_signature, lookup_analysis, store_analysis, lookup_analyses, store_analyses
 from app.models import TestResult
 from app.schemas import TestResultResponse
-from typing import List
+from typing import Any, Dict, List, Optional
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 def process_test_file(data):
     try:
@@ -22,35 +30,26 @@ def process_test_file(data):
         
         # Extract detailed failure location from stack trace
         failure_location = None
-        if failure_trace:
-            # Split stack trace into lines
-            stack_lines = failure_trace.split('\n')
-            for line in stack_lines:
-                if 'at ' in line and '(' in line and ')' in line:
-                    try:
-                        # Extract the method and file information
-                        method_part = line.split('at ')[1].split('(')[0].strip()
-                        file_part = line.split('(')[1].split(')')[0]
-                        
-                        # Split file part into file and line number
-                        file_parts = file_part.split(':')
-                        if len(file_parts) >= 2:
-                            file_name = file_parts[0]
-                            line_number = file_parts[1]
-                            
-                            failure_location = {
-                                'file': file_name,
-                                'line': line_number,
-                                'method': method_part,
-                                'full_stack_line': line.strip()
-                            }
-                            break
-                    except:
-                        continue
+        frame = first_frame(failure_trace)
+        if frame:
+            failure_location = {
+                'file': frame['file'],
+                'line': str(frame['line']),
+                'method': frame['method'],
+                'full_stack_line': frame['full_stack_line']
+            }
+        
+        # Duration from the allure start/stop timestamps (milliseconds)
+        duration_ms = None
+        if data.get('start') is not None and data.get('stop') is not None:
+            duration_ms = data['stop'] - data['start']
         
         return {
             'class_name': class_name,
             'status': 'failed' if status in ['failed', 'broken'] else status,
+            'test_method': data.get('name', ''),
+            'full_test_name': data.get('fullName', ''),
+            'duration_ms': duration_ms,
             'failure_data': {
                 'message': failure_message,
                 'trace': failure_trace,
@@ -63,9 +62,8 @@ def process_test_file(data):
         print(f"Error processing file {data}: {str(e)}")
         return None
 
-def generate_failure_analysis(failure_data):
-    model = get_model()
-    prompt = f"""
+def build_analysis_prompt(failure_data):
+    return f"""
     Analyze these test failure details and provide a detailed analysis:
     1. Possible causes (be specific about the technical reasons)
     2. Possible solutions (provide concrete steps to resolve)
@@ -92,54 +90,161 @@ def generate_failure_analysis(failure_data):
         ]
     }}
     """
+
+def parse_analysis_response(response_text):
+    # Find the first '{' and last '}'
+    start_idx = response_text.find('{')
+    end_idx = response_text.rfind('}') + 1
     
+    if start_idx != -1 and end_idx != -1:
+        json_str = response_text[start_idx:end_idx]
+        return json.loads(json_str)
+    else:
+        raise ValueError("No valid JSON found in response")
+
+def request_failure_analysis(failure_data):
+    """Ask the model for an analysis; raises if no usable JSON comes back."""
+    prompt = build_analysis_prompt(failure_data)
+    # Wait for RPM/TPM quota instead of a fixed delay
+    get_rate_limiter().acquire(estimate_tokens(prompt))
+    with timed_llm_request():
+        response_text = get_backend().generate(prompt)
+    return parse_analysis_response(response_text)
+
+async def request_failure_analysis_async(failure_data):
+    prompt = build_analysis_prompt(failure_data)
+    await get_rate_limiter().acquire_async(estimate_tokens(prompt))
+    with timed_llm_request():
+        response_text = await asyncio.to_thread(get_backend().generate, prompt)
+    return parse_analysis_response(response_text)
+
+def fallback_analysis(error):
+    return {
+        "causes": [{
+            "cause": "Error analyzing failures",
+            "confidence": "low",
+            "technical_details": str(error)
+        }],
+        "solutions": [{
+            "solution": "Unable to generate solutions",
+            "priority": "low",
+            "implementation_steps": ["Check the error logs"]
+        }]
+    }
+
+def generate_failure_analysis(failure_data):
     try:
-        response = model.generate_content(prompt)
-        # Add delay to respect API rate limits
-        time.sleep(1)
-        
-        # Extract the JSON part from the response
-        response_text = response.text
-        # Find the first '{' and last '}'
-        start_idx = response_text.find('{')
-        end_idx = response_text.rfind('}') + 1
-        
-        if start_idx != -1 and end_idx != -1:
-            json_str = response_text[start_idx:end_idx]
-            return json.loads(json_str)
-        else:
-            raise ValueError("No valid JSON found in response")
-            
+        return request_failure_analysis(failure_data)
     except Exception as e:
         print(f"Error in analyze_failures: {str(e)}")
-        return {
-            "causes": [{
-                "cause": "Error analyzing failures",
-                "confidence": "low",
-                "technical_details": str(e)
-            }],
-            "solutions": [{
-                "solution": "Unable to generate solutions",
-                "priority": "low",
-                "implementation_steps": ["Check the error logs"]
-            }]
-        }
+        return fallback_analysis(e)
 
-def analyze_failures(class_results):
-    for class_name, results in class_results.items():
+def cached_failure_analysis(failure_data):
+    """Serve repeated failures from the in-process signature cache, then from
+    similar past failures, calling the model only when neither knows the answer.
+
+    Fallback analyses produced by model errors are never cached, so a
+    transient outage does not pin a useless answer to a signature.
+    """
+    signature = failure_signature(failure_data)
+    analysis = lookup_analysis(signature)
+    if analysis is not None:
+        return analysis
+    analysis = get_similarity_index().known_analysis(failure_data)
+    if analysis is not None:
+        return analysis
+    try:
+        analysis = request_failure_analysis(failure_data)
+    except Exception as e:
+        print(f"Error in analyze_failures: {str(e)}")
+        return fallback_analysis(e)
+    store_analysis(signature, analysis)
+    return analysis
+
+def plan_analyses(class_results):
+    """Set fail_percentage on every class and group the failing ones for analysis.
+
+    Returns the failure clusters of app.core.cluster: each is analyzed once,
+    through its representative, and the result is shared by all its classes.
+    """
+    for results in class_results.values():
         if results['total_tests'] > 0:
             results['fail_percentage'] = (results['failed'] / results['total_tests']) * 100
-            
-            # Analyze failures if any
-            if results['failure_details']:
-                print(f"Analyzing failures for class: {class_name}")
-                # Combine all failure details for analysis
-                combined_failures = {
-                    'message': '\n'.join(f['message'] for f in results['failure_details']),
-                    'trace': '\n'.join(f['trace'] for f in results['failure_details'])
-                }
-                analysis = generate_failure_analysis(combined_failures)
-                results['analysis'] = analysis
+    return cluster_failures(class_results)
+
+def analyze_failures(class_results):
+    """Sequential, database-free analysis of an accumulator (used by the benchmarks)."""
+    for cluster in plan_analyses(class_results):
+        print(f"Analyzing failures for class: {', '.join(cluster['classes'])}")
+        analysis = cached_failure_analysis(cluster['failure_input'])
+        for class_name in cluster['classes']:
+            class_results[class_name]['analysis'] = analysis
+        get_similarity_index().add(cluster['classes'], cluster['failure_input'], analysis)
+    return dict(class_results)
+
+async def lookup_known_analyses(class_results, session: Optional[AsyncSession] = None):
+    """Plan the analyses of an upload and resolve the already known ones; reads only.
+
+    Returns the clusters by signature, as `{signature: (failure_input,
+    class_names)}`, and the cached analyses by signature. Nothing else
+    needs the session until the fresh analyses are stored, so callers can
+    end the transaction before complete_analyses runs the model calls.
+    """
+    by_signature = {}
+    for cluster in plan_analyses(class_results):
+        by_signature.setdefault(cluster['signature'], (cluster['failure_input'], []))[1].extend(cluster['classes'])
+
+    cached = await lookup_analyses(by_signature, session)
+    if session is not None:
+        # Normally already loaded at startup; offline callers (no session) skip it
+        await get_similarity_index().ensure_loaded_async()
+    return by_signature, cached
+
+async def complete_analyses(class_results, by_signature, cached) -> Dict[str, Dict[str, Any]]:
+    """Set the analysis of every failing class, asking the model for the unknown ones.
+
+    Similar past failures are consulted before the model. At most
+    LLM_MAX_CONCURRENCY requests run at once; the shared rate limiter keeps
+    the combined request rate within the model quota. Returns the fresh
+    analyses by signature, for store_analyses.
+    """
+    index = get_similarity_index()
+    fresh = {}
+    semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
+    async def analyze_signature(signature, failure_input, class_names):
+        analysis = cached.get(signature)
+        if analysis is None:
+            # Known answers of similar past failures come before the model
+            analysis = index.known_analysis(failure_input)
+        if analysis is None:
+            async with semaphore:
+                print(f"Analyzing failures for class: {', '.join(class_names)}")
+                try:
+                    analysis = await request_failure_analysis_async(failure_input)
+                    fresh[signature] = analysis
+                except Exception as e:
+                    print(f"Error in analyze_failures: {str(e)}")
+                    analysis = fallback_analysis(e)
+        for class_name in class_names:
+            class_results[class_name]['analysis'] = analysis
+        index.add(class_names, failure_input, analysis)
+
+    await asyncio.gather(*(
+        analyze_signature(signature, failure_input, class_names)
+        for signature, (failure_input, class_names) in by_signature.items()
+    ))
+    return fresh
+
+async def analyze_failures_async(class_results, session: Optional[AsyncSession] = None):
+    """Concurrent variant of analyze_failures for use inside the event loop.
+
+    Cached analyses are resolved in one batch before any model call (see
+    lookup_known_analyses and complete_analyses).
+    """
+    by_signature, cached = await lookup_known_analyses(class_results, session)
+    fresh = await complete_analyses(class_results, by_signature, cached)
+    await store_analyses(fresh, session)
     return dict(class_results)
 
 def push_to_db(test_results: List[TestResultResponse], session: Session):
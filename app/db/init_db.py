@@ -1,9 +1,13 @@
 from app.core.config import settings, logger
+from app.core.metrics import timed_checkout
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import HTTPException
-from app.models import Base
+from app.models import Base, TestResultHistory, utcnow
+from datetime import date
+from contextlib import asynccontextmanager
 import asyncio
 import os
 import sys
@@ -26,9 +30,27 @@ engine = create_engine(
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine and session factory for the FastAPI routes and the worker
+async_engine = create_async_engine(
+    settings.DB_ASYNC_CONNECTION_STRING(environment=settings.ENVIRONMENT),
+    pool_size=20,
+    max_overflow=20,
+    pool_timeout=60,
+    pool_recycle=3600,
+    pool_pre_ping=True
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 def get_session():
     session = SessionLocal()
     try:
+        with timed_checkout("sync"):
+            session.connection()
         yield session
     except SQLAlchemyError as e:
         logger.error(f"SQLAlchemyError: {e}")
@@ -37,6 +59,99 @@ def get_session():
     finally:
         session.close()
 
+@asynccontextmanager
+async def async_session_scope():
+    """An async session with the connection checked out, for routes that may not need one."""
+    async with AsyncSessionLocal() as session:
+        try:
+            # Check out eagerly so pool wait time is measured per request
+            with timed_checkout("async"):
+                await session.connection()
+            yield session
+        except SQLAlchemyError as e:
+            logger.error(f"SQLAlchemyError: {e}")
+            await session.rollback()
+            raise HTTPException(status_code=500, detail=f"Database error: {e}")
+
+async def get_async_session():
+    async with async_session_scope() as session:
+        yield session
+
+def month_start(value: date, months_ahead: int = 0) -> date:
+    month_index = value.year * 12 + value.month - 1 + months_ahead
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+# Key of the advisory lock serializing partition maintenance across processes
+HISTORY_PARTITION_LOCK_KEY = 7_246_001
+
+def _create_month_partition(connection, table: str, default: str, start: date):
+    end = month_start(start, 1)
+    name = f"{table}_y{start.year}m{start.month:02d}"
+    if connection.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return
+    bounds = {"start": start, "end": end}
+    spilled = connection.execute(text(
+        f"SELECT 1 FROM {default} WHERE changed_at >= :start AND changed_at < :end LIMIT 1"
+    ), bounds).first()
+    if spilled is None:
+        connection.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM ('{start}') TO ('{end}');"
+        ))
+        return
+    # Postgres refuses a partition whose range has rows in the default
+    # partition, so create it detached, move those rows, then attach it
+    logger.info(f"Moving {start:%Y-%m} history rows out of {default}")
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);"))
+    connection.execute(text(
+        f"WITH moved AS (DELETE FROM {default} WHERE changed_at >= :start AND changed_at < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved;"
+    ), bounds)
+    connection.execute(text(
+        f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}');"
+    ))
+
+def ensure_history_partitions(connection, months_ahead: int = None):
+    """Create monthly partitions of test_result_history up to `months_ahead` months out.
+
+    A DEFAULT partition catches anything outside the created ranges, so
+    inserts never fail if partition maintenance falls behind. Months that
+    did spill into it get their own partition here, with their rows moved
+    out of the default partition. Concurrent callers are serialized by an
+    advisory lock; all but one return without doing anything. The caller
+    commits.
+    """
+    if months_ahead is None:
+        months_ahead = settings.HISTORY_PARTITION_MONTHS_AHEAD
+    if not connection.execute(
+        text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": HISTORY_PARTITION_LOCK_KEY}
+    ).scalar():
+        return
+    table = TestResultHistory.__tablename__
+    default = f"{table}_default"
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {default} PARTITION OF {table} DEFAULT;"
+    ))
+    # changed_at is UTC
+    today = utcnow().date()
+    months = {month_start(today, offset) for offset in range(0, months_ahead + 1)}
+    months.update(
+        month.date() for month in connection.execute(text(
+            f"SELECT DISTINCT date_trunc('month', changed_at) FROM {default}"
+        )).scalars()
+    )
+    for start in sorted(months):
+        _create_month_partition(connection, table, default, start)
+
+async def maintain_history_partitions():
+    """Keep history partitions HISTORY_PARTITION_MONTHS_AHEAD months ahead, every HISTORY_PARTITION_CHECK_SECONDS."""
+    while True:
+        try:
+            async with async_engine.begin() as connection:
+                await connection.run_sync(ensure_history_partitions)
+        except Exception as e:
+            logger.warning(f"History partition maintenance failed: {e}")
+        await asyncio.sleep(settings.HISTORY_PARTITION_CHECK_SECONDS)
+
 async def init_db():
     """Initialize the database by creating all tables and schemas."""
     try:
@@ -44,12 +159,17 @@ async def init_db():
         with engine.connect() as connection:
             logger.info("Creating database schema...")
             connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema_name};"))
+            # Trigram operator classes for the search indexes on test_case_results
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
             connection.commit()
             logger.info(f"Schema {schema_name} created or already exists")
 
         # Create all tables
         logger.info("Creating database tables...")
         Base.metadata.create_all(bind=engine)
+        with engine.connect() as connection:
+            ensure_history_partitions(connection)
+            connection.commit()
         logger.info("Database tables created successfully")
 
     except SQLAlchemyError as e:
@@ -1,10 +1,24 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.routes import router as api_router
-from app.db.init_db import init_db
+from app.db.init_db import init_db, maintain_history_partitions
+from app.core.similarity import get_similarity_index
+from contextlib import asynccontextmanager
 import asyncio
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # History partitions are kept ahead of time by every process; an
+    # advisory lock lets only one of them work at a time
+    partitions = asyncio.create_task(maintain_history_partitions())
+    similarity = asyncio.create_task(get_similarity_index().ensure_loaded_async())
+    yield
+    partitions.cancel()
+    similarity.cancel()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
@@ -20,6 +34,11 @@ app.include_router(api_router)
 async def health_check():
     return {"message": "Hello World"}
 
+@app.get("/metrics", tags=["health"])
+async def metrics():
+    """Prometheus exposition of the ingestion, LLM and connection-pool metrics."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 
 
 if __name__ == "__main__":
@@ -1,13 +1,31 @@
 from app.core.config import settings
-from sqlalchemy import Column, String, Integer, Float, JSON, DateTime, Boolean
+from sqlalchemy import Column, String, Integer, BigInteger, Float, JSON, DateTime, Boolean, Text, LargeBinary, ForeignKey, Index, Computed, func
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime, timezone
+import uuid
 
 Base = declarative_base()
 
+def utcnow() -> datetime:
+    """Current UTC time without tzinfo, as the DateTime (TIMESTAMP WITHOUT TIME ZONE) columns store it.
+
+    asyncpg refuses timezone-aware values for these columns.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def utcnow_sql():
+    """Server-side utcnow(): the transaction time in UTC, whatever the session time zone."""
+    return func.timezone('UTC', func.now())
+
+def naive_utc(value: datetime) -> datetime:
+    """`value` converted to naive UTC for comparison with DateTime columns; naive values are taken as UTC."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
 class TestResult(Base):
     __tablename__ = "test_results"
 
@@ -16,13 +34,169 @@ class TestResult(Base):
     passed = Column(Integer, default=0)
     failed = Column(Integer, default=0)
     fail_percentage = Column(Float, default=0.0)
-    failure_details = Column(JSONB)  # List of failure details
-    analysis = Column(JSONB)  # Contains causes and solutions
+    # Heavy JSONB columns are deferred so summary queries never fetch them
+    failure_details = deferred(Column(JSONB))  # List of failure details
+    analysis = deferred(Column(JSONB))  # Contains causes and solutions
     last_updated = Column(DateTime, default=datetime.now(timezone.utc))
     is_active = Column(Boolean, default=True)
     version = Column(Integer, default=1)  # For tracking changes
     created_at = Column(DateTime, default=datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
 
+class TestRun(Base):
+    """One ingested build (or single upload); append-only."""
+    __tablename__ = "test_runs"
+
+    id = Column(BigInteger, primary_key=True)
+    build_id = Column(String, nullable=True, index=True)
+    run_at = Column(DateTime, default=utcnow)
+    total_tests = Column(Integer, default=0)
+    passed = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+
+class TestCaseResult(Base):
+    """Outcome of one test method in one run; append-only."""
+    __tablename__ = "test_case_results"
+
+    id = Column(BigInteger, primary_key=True)
+    run_id = Column(BigInteger, ForeignKey("test_runs.id", ondelete="CASCADE"), index=True)
+    test_name = Column(String, nullable=False)  # Test class, as in test_results
+    test_method = Column(String)
+    full_test_name = Column(String)
+    status = Column(String)
+    duration_ms = Column(Integer, nullable=True)
+    message = Column(Text, nullable=True)
+    trace_hash = Column(String(64), nullable=True)  # Key of the trace in trace_blobs
+    failure_location = Column(JSONB, nullable=True)
+    test_file = Column(String, nullable=True)
+    run_at = Column(DateTime)  # Copied from the run so per-class history needs no join
+    # Extracted from the failure for search
+    exception_type = Column(String, nullable=True)
+    failure_file = Column(String, nullable=True)
+    failure_method = Column(String, nullable=True)
+    search_vector = Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('simple', coalesce(exception_type, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(left(message, 65536), '')), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(failure_file, '') || ' ' || coalesce(failure_method, '')), 'C')",
+        persisted=True
+    ))
+
+    __table_args__ = (
+        Index("ix_test_case_results_test_name_run_at", "test_name", "run_at"),
+        Index("ix_test_case_results_status", "status"),
+        Index("ix_test_case_results_search_vector", "search_vector", postgresql_using="gin"),
+        # Trigram indexes serve substring (ILIKE) search; they need the pg_trgm extension
+        Index("ix_test_case_results_message_trgm", "message", postgresql_using="gin", postgresql_ops={"message": "gin_trgm_ops"}),
+        Index("ix_test_case_results_exception_type_trgm", "exception_type", postgresql_using="gin", postgresql_ops={"exception_type": "gin_trgm_ops"}),
+        Index("ix_test_case_results_failure_file_trgm", "failure_file", postgresql_using="gin", postgresql_ops={"failure_file": "gin_trgm_ops"}),
+        Index("ix_test_case_results_failure_method_trgm", "failure_method", postgresql_using="gin", postgresql_ops={"failure_method": "gin_trgm_ops"}),
+    )
+
+class TestFlakiness(Base):
+    """Rolling flakiness statistics of one test method, updated on every run."""
+    __tablename__ = "test_flakiness"
+
+    test_id = Column(String, primary_key=True)  # Full test name (class and method)
+    test_name = Column(String, index=True)  # Test class, as in test_results
+    runs = Column(Integer, default=0)
+    failures = Column(Integer, default=0)
+    flips = Column(Integer, default=0)  # Pass/fail changes over all runs
+    window = Column(String, default="")  # Last FLAKY_WINDOW outcomes, oldest first ('P'/'F')
+    window_flips = Column(Integer, default=0)  # Pass/fail changes within the window
+    last_status = Column(String(1), nullable=True)
+    current_run_length = Column(Integer, default=0)
+    run_lengths = Column(JSONB)  # {"P": {length: count}, "F": {length: count}} of completed runs
+    ewma_fail_rate = Column(Float, default=0.0)
+    flakiness_score = Column(Float, default=0.0, index=True)  # Flip rate within the window
+    updated_at = Column(DateTime, default=utcnow)
+
+class FailureSignature(Base):
+    __tablename__ = "failure_signatures"
+
+    signature = Column(String(64), primary_key=True)  # sha256 of the normalized failure
+    analysis = Column(JSONB)  # Cached causes and solutions
+    created_at = Column(DateTime, default=utcnow)
+
+class TraceBlob(Base):
+    """Stack traces stored once, compressed, and referenced by hash from failure details and test cases."""
+    __tablename__ = "trace_blobs"
+
+    hash = Column(String(64), primary_key=True)  # sha256 of the trace text
+    data = Column(LargeBinary, nullable=False)  # zlib-compressed UTF-8 trace
+    size = Column(Integer)  # Uncompressed length in bytes
+    created_at = Column(DateTime, server_default=utcnow_sql())
+
+class TestResultHistory(Base):
+    """Snapshot of a test_results row after every change, partitioned by month of changed_at."""
+    __tablename__ = "test_result_history"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    changed_at = Column(DateTime, primary_key=True, server_default=utcnow_sql())  # Partition key, UTC
+    test_name = Column(String, nullable=False)
+    version = Column(Integer)
+    total_tests = Column(Integer)
+    passed = Column(Integer)
+    failed = Column(Integer)
+    fail_percentage = Column(Float)
+    failure_details = Column(JSONB)
+    analysis = Column(JSONB)
+    change_type = Column(String)  # 'create', 'update'
+    changed_by = Column(String)  # Could be system or user identifier
+    change_reason = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_test_result_history_test_name_changed_at", "test_name", "changed_at"),
+        {"postgresql_partition_by": "RANGE (changed_at)"},
+    )
+
+class BuildClassResult(Base):
+    """Per-class counters of a build uploaded over several requests, until it is final."""
+    __tablename__ = "build_class_results"
+
+    build_id = Column(String, primary_key=True)
+    test_name = Column(String, primary_key=True)
+    total_tests = Column(Integer, default=0)
+    passed = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    failure_details = Column(JSONB)
+    cases = Column(JSONB)  # Per-test outcomes, written to test_case_results when final
+    updated_at = Column(DateTime, default=utcnow)
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    status = Column(String, default="queued")  # 'queued', 'running', 'done', 'failed'
+    build_id = Column(String, nullable=True)
+    final = Column(Boolean, default=True)  # False while more uploads of build_id are expected
+    attempts = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=utcnow)
+    locked_at = Column(DateTime, nullable=True)  # Worker lease, refreshed by the worker's heartbeat while the job runs
+    finished_at = Column(DateTime, nullable=True)
+
+    files = relationship("IngestionJobFile", back_populates="job", order_by="IngestionJobFile.id")
+
+    __table_args__ = (
+        Index("ix_ingestion_jobs_status_created_at", "status", "created_at"),
+    )
+
+class IngestionJobFile(Base):
+    __tablename__ = "ingestion_job_files"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String(36), ForeignKey("ingestion_jobs.id", ondelete="CASCADE"), index=True)
+    filename = Column(String)
+    size = Column(BigInteger, default=0)  # Bytes stored in ingestion_job_chunks
+    status = Column(String, default="pending")  # 'pending', 'ok', 'error'
+    outcome = Column(JSONB, nullable=True)
+
+    job = relationship("IngestionJob", back_populates="files")
 
+class IngestionJobChunk(Base):
+    """Raw upload of a queued file, in UPLOAD_STORE_CHUNK_BYTES pieces; deleted once processed."""
+    __tablename__ = "ingestion_job_chunks"
 
+    job_file_id = Column(Integer, ForeignKey("ingestion_job_files.id", ondelete="CASCADE"), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    data = Column(LargeBinary)
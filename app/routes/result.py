@@ -1,104 +1,437 @@
-from fastapi import HTTPException, Depends, UploadFile, File, APIRouter    
-from sqlalchemy.orm import Session
-from typing import List, Any
-from collections import defaultdict
-import json
-import os
-import google.generativeai as genai
-import time
-from app.db.init_db import get_session
-from app.core.utils import process_test_file, analyze_failures
+from fastapi import HTTPException, Depends, UploadFile, File, APIRouter, Query, Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import select, insert, func
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Any, Optional
+from datetime import datetime
+import base64
+from app.db.init_db import get_async_session, async_session_scope
+from app.core.ingest import ingest_files, upload_records
+from app.core.cache import get_cache_stats
+from app.core import readcache
+from app.core.traces import load_traces, resolve_traces
 from app.core.config import settings
-from app.models import TestResult
-from datetime import datetime, timezone
-import asyncio
+from app.models import IngestionJob, IngestionJobFile, IngestionJobChunk, TestRun, TestCaseResult, TestResult, TestResultHistory, TestFlakiness, naive_utc
 
 router = APIRouter(prefix="/result", tags=["result"])
 
+# Everything but the failure_details / analysis JSONB, which are served by
+# the /failures and /analysis sub-resources
+SUMMARY_COLUMNS = (
+    TestResult.test_name,
+    TestResult.total_tests,
+    TestResult.passed,
+    TestResult.failed,
+    TestResult.fail_percentage,
+    TestResult.last_updated,
+    TestResult.version,
+    TestResult.created_at,
+    TestResult.updated_at
+)
+
+def encode_cursor(test_name: str) -> str:
+    return base64.urlsafe_b64encode(test_name.encode()).decode()
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor.encode()).decode()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/", response_model=Any)
+async def list_test_results(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    min_fail_percentage: Optional[float] = Query(None, ge=0, le=100),
+    max_fail_percentage: Optional[float] = Query(None, ge=0, le=100),
+    updated_since: Optional[datetime] = Query(None),
+    name_prefix: Optional[str] = Query(None),
+    session: AsyncSession = Depends(get_async_session)
+    ):
+    """Active test result summaries ordered by name, one keyset-paginated page at a time.
+
+    Pages are addressed by the last test name seen rather than an offset,
+    so every page is an index range scan on the primary key.
+    """
+    stmt = select(*SUMMARY_COLUMNS).where(TestResult.is_active == True)
+    if cursor is not None:
+        stmt = stmt.where(TestResult.test_name > decode_cursor(cursor))
+    if name_prefix:
+        # The range condition lets Postgres use the primary key index
+        stmt = stmt.where(
+            TestResult.test_name >= name_prefix,
+            TestResult.test_name.startswith(name_prefix, autoescape=True)
+        )
+    if min_fail_percentage is not None:
+        stmt = stmt.where(TestResult.fail_percentage >= min_fail_percentage)
+    if max_fail_percentage is not None:
+        stmt = stmt.where(TestResult.fail_percentage <= max_fail_percentage)
+    if updated_since is not None:
+        stmt = stmt.where(TestResult.last_updated >= naive_utc(updated_since))
+
+    # One extra row tells us whether there is a next page
+    rows = (await session.execute(
+        stmt.order_by(TestResult.test_name).limit(limit + 1)
+    )).all()
+    next_cursor = encode_cursor(rows[limit - 1].test_name) if len(rows) > limit else None
+
+    return ORJSONResponse({
+        "items": [dict(row._mapping) for row in rows[:limit]],
+        "next_cursor": next_cursor
+    })
+
+@router.get("/flaky", response_model=Any)
+async def list_flaky_tests(
+    limit: int = Query(20, ge=1, le=500),
+    min_runs: int = Query(5, ge=1),
+    session: AsyncSession = Depends(get_async_session)
+    ):
+    """Most flaky test methods by flip rate over the rolling window, from stored statistics."""
+    result = await session.execute(
+        select(
+            TestFlakiness.test_id,
+            TestFlakiness.test_name,
+            TestFlakiness.flakiness_score,
+            TestFlakiness.ewma_fail_rate,
+            TestFlakiness.runs,
+            TestFlakiness.failures,
+            TestFlakiness.flips,
+            TestFlakiness.window,
+            TestFlakiness.run_lengths,
+            TestFlakiness.last_status,
+            TestFlakiness.updated_at
+        )
+        .where(TestFlakiness.runs >= min_runs)
+        .order_by(TestFlakiness.flakiness_score.desc())
+        .limit(limit)
+    )
+    return ORJSONResponse([dict(row._mapping) for row in result])
+
+def _like_pattern(query: str) -> str:
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+@router.get("/search", response_model=Any)
+async def search_failures(
+    q: str = Query(..., min_length=2, description="Words or a fragment of a failure message, exception, file or method"),
+    exception_type: Optional[str] = Query(None, description="Only failures with exactly this exception type"),
+    since: Optional[datetime] = Query(None, description="Only failures recorded at or after this time"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    session: AsyncSession = Depends(get_async_session)
+    ):
+    """Failed test cases matching `q`, best match first, one keyset-paginated page at a time.
+
+    Words are matched against the weighted search_vector (exception type,
+    then message, then failure file/method) through its GIN index; any
+    substring of those columns is matched through their trigram indexes.
+    The rank adds the full-text rank to the trigram word similarity of
+    the message.
+    """
+    ts_query = func.websearch_to_tsquery('english', q)
+    pattern = _like_pattern(q)
+    rank = (
+        func.ts_rank_cd(TestCaseResult.search_vector, ts_query)
+        + func.word_similarity(q, func.coalesce(TestCaseResult.message, ''))
+    ).label("rank")
+
+    stmt = select(
+        TestCaseResult.id,
+        TestCaseResult.run_id,
+        TestCaseResult.run_at,
+        TestCaseResult.test_name,
+        TestCaseResult.test_method,
+        TestCaseResult.exception_type,
+        TestCaseResult.failure_file,
+        TestCaseResult.failure_method,
+        func.left(TestCaseResult.message, 500).label("message"),
+        rank
+    ).where(
+        TestCaseResult.status == "failed",
+        TestCaseResult.search_vector.op('@@')(ts_query)
+        | TestCaseResult.message.ilike(pattern, escape='\\')
+        | TestCaseResult.exception_type.ilike(pattern, escape='\\')
+        | TestCaseResult.failure_file.ilike(pattern, escape='\\')
+        | TestCaseResult.failure_method.ilike(pattern, escape='\\')
+    )
+    if exception_type:
+        stmt = stmt.where(TestCaseResult.exception_type == exception_type)
+    if since is not None:
+        stmt = stmt.where(TestCaseResult.run_at >= naive_utc(since))
+    if cursor is not None:
+        # Keyset on (rank, id): the rank of a row is the same on every page
+        try:
+            last_rank, last_id = decode_cursor(cursor).split(':')
+            last_rank, last_id = float(last_rank), int(last_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        stmt = stmt.where(
+            (rank.element < last_rank) | ((rank.element == last_rank) & (TestCaseResult.id < last_id))
+        )
+
+    # One extra row tells us whether there is a next page
+    rows = (await session.execute(
+        stmt.order_by(rank.desc(), TestCaseResult.id.desc()).limit(limit + 1)
+    )).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(f"{last.rank!r}:{last.id}")
+
+    return ORJSONResponse({
+        "items": [dict(row._mapping) for row in rows[:limit]],
+        "next_cursor": next_cursor
+    })
+
 @router.post(
         "/upload", 
         response_model=Any
         )
 async def create_or_update_test_result(
     files: List[UploadFile] = File(...), 
-    session: Session = Depends(get_session)
+    async_mode: bool = Query(False, alias="async"),
+    build_id: Optional[str] = Query(None),
+    final: bool = Query(True),
+    session: AsyncSession = Depends(get_async_session)
     ):
+    """Aggregate all files per class, then analyze and store them once.
+
+    A build split over several requests passes the same `build_id` with
+    `final=false` on all but the last request; its classes are staged and
+    only analyzed and written when the final request arrives.
+    """
     
-    response = []
+    if async_mode:
+        return await enqueue_upload(files, session, build_id, final)
+
+    # Records are decoded from the upload stream as they arrive
+    try:
+        response = await ingest_files(
+            [(file.filename, upload_records([file])) for file in files], session, build_id, final
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error storing results: {e}")
+            
+    return {"message": "Test results uploaded successfully", "files": response} 
+
+async def enqueue_upload(files: List[UploadFile], session: AsyncSession, build_id: Optional[str], final: bool):
+    """Store the upload as a job for app.worker and answer 202 right away.
+
+    Each file is copied to ingestion_job_chunks UPLOAD_STORE_CHUNK_BYTES at
+    a time, so no file is ever held in memory or bound as one parameter.
+    """
+    job = IngestionJob(build_id=build_id, final=final)
+    session.add(job)
     for file in files:
-        class_results = defaultdict(lambda: {
-            'total_tests': 0,
-            'passed': 0,
-            'failed': 0,
-            'fail_percentage': 0,
-            'failure_details': [],
-            'analysis': {
-                'causes': [],
-                'solutions': []
+        job_file = IngestionJobFile(filename=file.filename, size=0)
+        job.files.append(job_file)
+        await session.flush()
+        seq = 0
+        while chunk := await file.read(settings.UPLOAD_STORE_CHUNK_BYTES):
+            await session.execute(insert(IngestionJobChunk).values(job_file_id=job_file.id, seq=seq, data=chunk))
+            job_file.size += len(chunk)
+            seq += 1
+    await session.commit()
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/v1/result/jobs/{job.id}"
+        }
+    )
+
+@router.get("/jobs/{job_id}", response_model=Any)
+async def get_ingestion_job(job_id: str, session: AsyncSession = Depends(get_async_session)):
+    """Status of a queued upload and the outcome of each of its files."""
+    job = (await session.execute(
+        select(IngestionJob)
+        .options(selectinload(IngestionJob.files))
+        .where(IngestionJob.id == job_id)
+    )).scalars().first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "build_id": job.build_id,
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "files": [
+            {
+                "filename": job_file.filename,
+                "size": job_file.size,
+                "status": job_file.status,
+                "outcome": job_file.outcome
             }
-        })
-        try:
-            # Read and parse JSON content
-            content = await file.read()
-            file_content = json.loads(content.decode())
-            test_info = process_test_file(file_content)
-            if test_info and test_info['class_name']:
-                class_name = test_info['class_name']
-                class_results[class_name]['total_tests'] += 1
-                
-                if test_info['status'] == 'passed':
-                    class_results[class_name]['passed'] += 1
-                elif test_info['status'] == 'failed':
-                    class_results[class_name]['failed'] += 1
-                    if test_info['failure_data']:
-                        # Add test file information to failure details
-                        failure_data = test_info['failure_data']
-                        failure_data['test_file'] = file.filename
-                        class_results[class_name]['failure_details'].append(failure_data)
-            class_results = analyze_failures(class_results)
-            
-            # Save results to database asynchronously
-            for class_name, result in class_results.items():
-                # Calculate fail percentage
-                if result['total_tests'] > 0:
-                    result['fail_percentage'] = (result['failed'] / result['total_tests']) * 100
-                
-                # Create or update test result
-                test_result = session.query(TestResult).filter_by(test_name=class_name).first()
-                if test_result:
-                    # Update existing record
-                    test_result.total_tests = result['total_tests']
-                    test_result.passed = result['passed']
-                    test_result.failed = result['failed']
-                    test_result.fail_percentage = result['fail_percentage']
-                    test_result.failure_details = result['failure_details']
-                    test_result.analysis = result['analysis']
-                    test_result.last_updated = datetime.now(timezone.utc)
-                    test_result.version += 1
-                else:
-                    # Create new record
-                    test_result = TestResult(
-                        test_name=class_name,
-                        total_tests=result['total_tests'],
-                        passed=result['passed'],
-                        failed=result['failed'],
-                        fail_percentage=result['fail_percentage'],
-                        failure_details=result['failure_details'],
-                        analysis=result['analysis']
-                    )
-                    session.add(test_result)
-                
-                # Commit changes asynchronously
-                await asyncio.to_thread(session.commit)
-            
-            response.append(class_results)
-        except Exception as e:
-            print(f"Error processing {file.filename}: {str(e)}")
-            session.rollback()
-            
-    return {"message": "Test results uploaded successfully"} 
+            for job_file in job.files
+        ]
+    }
 
-            
+@router.get("/traces/{trace_hash}", response_model=Any)
+async def get_trace(trace_hash: str, session: AsyncSession = Depends(get_async_session)):
+    """One stored stack trace, as referenced by the trace_hash of failures and test cases."""
+    traces = await load_traces([trace_hash], session)
+    if trace_hash not in traces:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    # Content-addressed, so a trace never changes
+    return ORJSONResponse(
+        {"trace_hash": trace_hash, "trace": traces[trace_hash]},
+        headers={"ETag": f'"{trace_hash}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    )
 
+async def fetch_class_column(session: AsyncSession, test_name: str, *columns):
+    row = (await session.execute(
+        select(TestResult.test_name, *columns).where(TestResult.test_name == test_name)
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Test result not found")
+    return dict(row._mapping)
 
-            
+async def cached_class_read(request: Request, test_name: str, resource: str, *columns, resolve=None) -> Response:
+    """Serve a class read from the in-process read cache, keyed by test name and version.
+
+    `columns` must include TestResult.version, which is also the ETag. A
+    matching If-None-Match on a recently read class is answered with 304
+    without checking out a connection. `resolve` may complete the fetched
+    row with the same session before it is rendered and cached.
+    """
+    if_none_match = request.headers.get('if-none-match')
+    version = readcache.current_version(test_name)
+    if version is not None:
+        etag = readcache.make_etag(version)
+        if readcache.etag_matches(if_none_match, etag):
+            readcache.record_lookup('not_modified')
+            return Response(status_code=304, headers={'ETag': etag})
+        body = readcache.get_body(test_name, version, resource)
+        if body is not None:
+            readcache.record_lookup('hit')
+            return Response(body, media_type='application/json', headers={'ETag': etag})
+
+    readcache.record_lookup('miss')
+    started = readcache.read_started()
+    async with async_session_scope() as session:
+        data = await fetch_class_column(session, test_name, *columns)
+        if resolve is not None:
+            data = await resolve(data, session)
+    etag = readcache.make_etag(data['version'])
+    response = ORJSONResponse(data, headers={'ETag': etag})
+    readcache.put(test_name, data['version'], resource, response.body, started)
+    if readcache.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    return response
+
+@router.get("/{test_name}", response_model=Any)
+async def get_test_result(test_name: str, request: Request):
+    """Counters of one class without its failure details or analysis."""
+    return await cached_class_read(request, test_name, 'summary', *SUMMARY_COLUMNS[1:])
+
+async def _resolve_failure_traces(data, session: AsyncSession):
+    data['failure_details'] = await resolve_traces(data['failure_details'], session)
+    return data
+
+@router.get("/{test_name}/failures", response_model=Any)
+async def get_test_result_failures(
+    test_name: str,
+    request: Request,
+    include_traces: bool = Query(True, description="Decompress each failure's trace; otherwise only its trace_hash is returned")
+    ):
+    if not include_traces:
+        return await cached_class_read(
+            request, test_name, 'failures:hashes', TestResult.version, TestResult.failure_details
+        )
+    return await cached_class_read(
+        request, test_name, 'failures', TestResult.version, TestResult.failure_details,
+        resolve=_resolve_failure_traces
+    )
+
+@router.get("/{test_name}/analysis", response_model=Any)
+async def get_test_result_analysis(test_name: str, request: Request):
+    return await cached_class_read(
+        request, test_name, 'analysis', TestResult.version, TestResult.analysis
+    )
+
+HISTORY_SUMMARY_COLUMNS = (
+    TestResultHistory.version,
+    TestResultHistory.changed_at,
+    TestResultHistory.change_type,
+    TestResultHistory.changed_by,
+    TestResultHistory.change_reason,
+    TestResultHistory.total_tests,
+    TestResultHistory.passed,
+    TestResultHistory.failed,
+    TestResultHistory.fail_percentage
+)
+
+@router.get("/{test_name}/history", response_model=Any)
+async def get_test_result_history(
+    test_name: str,
+    limit: int = Query(50, ge=1, le=1000),
+    before: Optional[datetime] = Query(None, description="Only changes strictly before this time"),
+    session: AsyncSession = Depends(get_async_session)
+    ):
+    """Versions of a class, newest first, without the heavy JSONB snapshots."""
+    stmt = select(*HISTORY_SUMMARY_COLUMNS).where(TestResultHistory.test_name == test_name)
+    if before is not None:
+        stmt = stmt.where(TestResultHistory.changed_at < naive_utc(before))
+    result = await session.execute(stmt.order_by(TestResultHistory.changed_at.desc()).limit(limit))
+    return ORJSONResponse([dict(row._mapping) for row in result])
+
+@router.get("/{test_name}/history/at", response_model=Any)
+async def get_test_result_at(
+    test_name: str,
+    at: datetime = Query(..., description="Point in time to reconstruct"),
+    session: AsyncSession = Depends(get_async_session)
+    ):
+    """Full state of a class as of `at`: the latest history row at or before it.
+
+    Served by the (test_name, changed_at) index as a single backward index probe.
+    """
+    row = (await session.execute(
+        select(
+            TestResultHistory.test_name,
+            *HISTORY_SUMMARY_COLUMNS,
+            TestResultHistory.failure_details,
+            TestResultHistory.analysis
+        )
+        .where(TestResultHistory.test_name == test_name, TestResultHistory.changed_at <= naive_utc(at))
+        .order_by(TestResultHistory.changed_at.desc())
+        .limit(1)
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="No history for this test result at that time")
+    data = dict(row._mapping)
+    data['failure_details'] = await resolve_traces(data['failure_details'], session)
+    return ORJSONResponse(data)
+
+@router.get("/{test_name}/runs", response_model=Any)
+async def get_class_runs(
+    test_name: str,
+    limit: int = Query(50, ge=1, le=1000),
+    session: AsyncSession = Depends(get_async_session)
+    ):
+    """Per-run counters of one class, newest first, for trend views."""
+    result = await session.execute(
+        select(
+            TestCaseResult.run_id,
+            TestCaseResult.run_at,
+            TestRun.build_id,
+            func.count().label("total_tests"),
+            func.count().filter(TestCaseResult.status == "passed").label("passed"),
+            func.count().filter(TestCaseResult.status == "failed").label("failed")
+        )
+        .join(TestRun, TestRun.id == TestCaseResult.run_id)
+        .where(TestCaseResult.test_name == test_name)
+        .group_by(TestCaseResult.run_id, TestCaseResult.run_at, TestRun.build_id)
+        .order_by(TestCaseResult.run_at.desc())
+        .limit(limit)
+    )
+    return [dict(row._mapping) for row in result]
+
+@router.get("/cache/stats", response_model=Any)
+async def analysis_cache_stats():
+    """Hit/miss counters for the failure-signature analysis cache."""
+    return get_cache_stats()
@@ -0,0 +1,213 @@
+"""Background worker for uploads queued with ``POST /v1/result/upload?async=true``.
+
+Run one or more with ``python -m app.worker``. Workers claim jobs with
+``FOR UPDATE SKIP LOCKED`` so they never block each other, and hold a lease
+that a heartbeat refreshes every third of JOB_LEASE_SECONDS while the job
+runs; a job whose worker died is picked up again once its lease expires.
+A job's files are aggregated and written in a single transaction, which
+also marks the job done only if this worker still holds the claim (same
+attempt), so a reclaimed job simply starts over and is never stored twice.
+"""
+import asyncio
+from contextlib import suppress
+from datetime import timedelta
+from typing import Optional
+from prometheus_client import start_http_server
+from sqlalchemy import select, update, delete, exists, or_, and_
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings, logger
+from app.core.metrics import timed_checkout
+from app.core.ingest import ingest_files, purge_abandoned_builds, stored_records
+from app.core.similarity import get_similarity_index
+from app.db.init_db import AsyncSessionLocal, maintain_history_partitions
+from app.models import IngestionJob, IngestionJobFile, IngestionJobChunk, utcnow
+
+async def claim_job(session: AsyncSession) -> Optional[IngestionJob]:
+    """Lease the oldest queued (or abandoned) job, or return None.
+
+    The final job of a build is held back while a part of the same build is
+    still queued or running (a failed part waits for its lease to expire),
+    so it never stores the build without a part that is about to be staged.
+    """
+    while True:
+        now = utcnow()
+        part = aliased(IngestionJob)
+        stmt = (
+            select(IngestionJob)
+            .where(or_(
+                IngestionJob.status == "queued",
+                and_(
+                    IngestionJob.status == "running",
+                    IngestionJob.locked_at < now - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+                )
+            ))
+            .where(or_(
+                IngestionJob.build_id.is_(None),
+                IngestionJob.final.is_(False),
+                ~exists().where(
+                    part.build_id == IngestionJob.build_id,
+                    part.final.is_(False),
+                    part.status.in_(("queued", "running"))
+                )
+            ))
+            .order_by(IngestionJob.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        job = (await session.execute(stmt)).scalars().first()
+        if job is None:
+            await session.rollback()
+            return None
+
+        if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+            job.status = "failed"
+            job.error = f"Gave up after {job.attempts} attempts"
+            job.finished_at = now
+            await session.commit()
+            continue
+
+        job.status = "running"
+        job.attempts += 1
+        job.locked_at = now
+        await session.commit()
+        return job
+
+def _claim_held(job_id: str, attempt: int):
+    return and_(
+        IngestionJob.id == job_id,
+        IngestionJob.status == "running",
+        IngestionJob.attempts == attempt
+    )
+
+async def heartbeat(job_id: str, attempt: int):
+    """Refresh the lease of a running job, in its own session, until cancelled."""
+    interval = max(settings.JOB_LEASE_SECONDS / 3, 1)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    update(IngestionJob)
+                    .where(_claim_held(job_id, attempt))
+                    .values(locked_at=utcnow())
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"Lease refresh of ingestion job {job_id} failed: {e}")
+            continue
+        if result.rowcount == 0:
+            logger.warning(f"Ingestion job {job_id} is no longer held by this worker; lease refresh stopped")
+            return
+
+async def stored_chunks(session: AsyncSession, job_file_id: int):
+    """The stored upload of a job file, fetched one chunk at a time."""
+    seq = 0
+    while True:
+        data = (await session.execute(
+            select(IngestionJobChunk.data)
+            .where(IngestionJobChunk.job_file_id == job_file_id, IngestionJobChunk.seq == seq)
+        )).scalar_one_or_none()
+        if data is None:
+            return
+        yield data
+        seq += 1
+
+async def process_job(session: AsyncSession, job: IngestionJob):
+    job_id = job.id
+    attempt = job.attempts
+    logger.info(f"Processing ingestion job {job_id} (attempt {attempt})")
+    lease = asyncio.create_task(heartbeat(job_id, attempt))
+    try:
+        job_files = (await session.execute(
+            select(IngestionJobFile)
+            .where(IngestionJobFile.job_id == job_id, IngestionJobFile.status == "pending")
+            .order_by(IngestionJobFile.id)
+        )).scalars().all()
+        # The results and the job's completion are committed together, so
+        # the upload is never lost nor stored twice. One file, and one chunk
+        # of it, is held in memory at a time.
+        outcomes = await ingest_files(
+            [
+                (job_file.filename, stored_records([(job_file.filename, stored_chunks(session, job_file.id))]))
+                for job_file in job_files
+            ],
+            session,
+            build_id=job.build_id,
+            final=job.final,
+            commit=False
+        )
+        for job_file, outcome in zip(job_files, outcomes):
+            job_file.status = outcome["status"]
+            job_file.outcome = outcome
+        await session.execute(
+            delete(IngestionJobChunk)
+            .where(IngestionJobChunk.job_file_id.in_([job_file.id for job_file in job_files]))
+            .execution_options(synchronize_session=False)
+        )
+
+        # Fenced on the claim: if the lease was lost and the job reclaimed,
+        # the new owner stores it and this attempt is discarded
+        done = await session.execute(
+            update(IngestionJob)
+            .where(_claim_held(job_id, attempt))
+            .values(status="done", finished_at=utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if done.rowcount != 1:
+            logger.warning(f"Ingestion job {job_id} was reclaimed by another worker; discarding attempt {attempt}")
+            await session.rollback()
+            return
+        await session.commit()
+    except Exception as e:
+        logger.error(f"Ingestion job {job_id} failed: {e}")
+        await session.rollback()
+        # Leave the job running; it is retried once the lease expires
+        await session.execute(
+            update(IngestionJob).where(IngestionJob.id == job_id).values(error=str(e))
+        )
+        await session.commit()
+    finally:
+        lease.cancel()
+        with suppress(asyncio.CancelledError):
+            await lease
+
+async def purge_staged_builds():
+    """Drop abandoned staged builds every HISTORY_PARTITION_CHECK_SECONDS."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                purged = await purge_abandoned_builds(session)
+                await session.commit()
+            if purged:
+                logger.info(f"Dropped {purged} staged classes of abandoned builds")
+        except Exception as e:
+            logger.warning(f"Staged build cleanup failed: {e}")
+        await asyncio.sleep(settings.HISTORY_PARTITION_CHECK_SECONDS)
+
+async def run_worker():
+    logger.info("Ingestion worker started")
+    if settings.WORKER_METRICS_PORT:
+        try:
+            start_http_server(settings.WORKER_METRICS_PORT)
+        except OSError as e:
+            # Another worker on this host already serves the port; give each
+            # worker its own WORKER_METRICS_PORT to scrape them all
+            logger.warning(f"Worker metrics not served on port {settings.WORKER_METRICS_PORT}: {e}")
+    # Referenced for the lifetime of the worker, so the tasks are not garbage collected
+    partitions = asyncio.create_task(maintain_history_partitions())
+    staged = asyncio.create_task(purge_staged_builds())
+    await get_similarity_index().ensure_loaded_async()
+    while True:
+        async with AsyncSessionLocal() as session:
+            with timed_checkout("async"):
+                await session.connection()
+            job = await claim_job(session)
+            if job is None:
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL_SECONDS)
+                continue
+            await process_job(session, job)
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
@@ -0,0 +1,79 @@
+"""Cold-start benchmark: interpreter start plus import of the API and CLI entry points.
+
+Each target runs in a fresh interpreter, so module caches from earlier runs
+do not flatter the numbers. Also reports whether the LLM SDK got loaded,
+which should only happen once an analysis is actually requested.
+
+Usage:
+    python -m benchmarks.bench_import --runs 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SDK_MODULE = "google.generativeai"
+
+TARGETS = {
+    "python": ["-c", "pass"],
+    "app.core.config": ["-c", "import app.core.config"],
+    "app.main": ["-c", "import app.main"],
+    "main --help": ["main.py", "--help"],
+}
+
+def sdk_loaded(target_args) -> bool:
+    """Whether running the target leaves the LLM SDK in sys.modules."""
+    if target_args[0] != "-c":
+        # Scripts exit inside argparse; run them through runpy and check afterwards
+        code = (
+            "import runpy, sys\n"
+            f"sys.argv = {target_args!r}\n"
+            "try:\n"
+            f"    runpy.run_path({target_args[0]!r}, run_name='__main__')\n"
+            "except SystemExit:\n"
+            "    pass\n"
+        )
+    else:
+        code = target_args[1]
+    code += f"\nimport sys; print({SDK_MODULE!r} in sys.modules)"
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()
+    return output[-1] == "True"
+
+def time_target(target_args, runs: int):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-W", "ignore", *target_args],
+            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
+        )
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    # Offline backend so importing never needs credentials
+    os.environ.setdefault("ANALYSIS_BACKEND", "stub")
+    for name, target_args in TARGETS.items():
+        latencies = time_target(target_args, args.runs)
+        print(json.dumps({
+            "benchmark": f"import[{name}]",
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "runs": args.runs,
+            "sdk_loaded": sdk_loaded(target_args) if name != "python" else False,
+        }))
+
+if __name__ == "__main__":
+    main()
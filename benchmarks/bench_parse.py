@@ -0,0 +1,94 @@
+"""Micro-benchmarks of the per-file parse and the per-class analysis stages.
+
+Analysis uses the stub backend (app.core.llm), so the numbers cover
+parsing, accumulation, prompt building and caching only.
+
+Usage:
+    python -m benchmarks.bench_parse --classes 500 --failure-ratio 0.2 --trace-depth 60
+    python -m benchmarks.bench_parse --model-latency 0.2 --analysis-mode async
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import time
+
+from benchmarks.common import configure_environment, install_stub_backend, report
+from benchmarks.generate import generate_results
+
+configure_environment()
+
+from app.core import cache
+from app.core.ingest import add_test_info, new_class_results
+from app.core.similarity import get_similarity_index
+from app.core.utils import analyze_failures, analyze_failures_async, process_test_file
+
+def bench_process_test_file(payloads):
+    """Decode and process each file the way the upload path does."""
+    class_results = new_class_results()
+    latencies = []
+    started = time.perf_counter()
+    for filename, payload in payloads:
+        t0 = time.perf_counter()
+        add_test_info(class_results, process_test_file(json.loads(payload)), filename)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    report("process_test_file", latencies, len(payloads), elapsed)
+    return class_results
+
+def bench_analyze_failures(payloads, mode: str, warm: bool, repeat: int):
+    """Time whole analysis passes, clustering included, over a freshly built accumulator."""
+    latencies = []
+    items = 0
+    for _ in range(repeat):
+        class_results = new_class_results()
+        for filename, payload in payloads:
+            add_test_info(class_results, process_test_file(json.loads(payload)), filename)
+        items += sum(1 for results in class_results.values() if results['failure_details'])
+
+        if not warm:
+            # Neither the signature cache nor the similarity index may answer
+            cache._lru.clear()
+            get_similarity_index.cache_clear()
+        # analyze_failures reports every cluster it sends to the model
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            if mode == "async":
+                asyncio.run(analyze_failures_async(class_results))
+            else:
+                analyze_failures(class_results)
+            latencies.append(time.perf_counter() - started)
+    report(
+        f"analyze_failures[{mode},{'warm' if warm else 'cold'}]",
+        latencies,
+        items,
+        sum(latencies),
+        unit="classes",
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--classes", type=int, default=200)
+    parser.add_argument("--tests-per-class", type=int, default=10)
+    parser.add_argument("--failure-ratio", type=float, default=0.1)
+    parser.add_argument("--trace-depth", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Seconds the stub backend waits per request")
+    parser.add_argument("--analysis-mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--repeat", type=int, default=3, help="Analysis passes per cache state")
+    args = parser.parse_args()
+
+    backend = install_stub_backend(args.model_latency)
+    payloads = [
+        (f"{result['uuid']}-result.json", json.dumps(result).encode())
+        for result in generate_results(args.classes, args.tests_per_class, args.failure_ratio, args.trace_depth, args.seed)
+    ]
+
+    bench_process_test_file(payloads)
+    bench_analyze_failures(payloads, args.analysis_mode, warm=False, repeat=args.repeat)
+    bench_analyze_failures(payloads, args.analysis_mode, warm=True, repeat=args.repeat)
+    print(json.dumps({"model_calls": backend.calls}))
+
+if __name__ == "__main__":
+    main()
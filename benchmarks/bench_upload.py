@@ -0,0 +1,107 @@
+"""End-to-end load benchmark of POST /v1/result/upload against Postgres.
+
+By default the app runs in-process (through httpx's ASGI transport) with the
+stub analysis backend, using the database configured by the usual DB_* variables.
+With --url the requests go to an already running server instead, whose
+analysis backend is its own; peak RSS then covers the client only.
+
+Usage:
+    python -m benchmarks.bench_upload --requests 50 --files-per-request 20 --concurrency 4 --init-db
+    python -m benchmarks.bench_upload --url http://localhost:8000 --requests 200
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import time
+import uuid
+
+from benchmarks.common import configure_environment, install_stub_backend, report
+from benchmarks.generate import generate_results
+
+configure_environment()
+
+import httpx
+
+def build_requests(args):
+    """Split the generated results into upload batches, one build per request."""
+    payloads = [
+        (f"{result['uuid']}-result.json", json.dumps(result).encode())
+        for result in generate_results(args.classes, args.tests_per_class, args.failure_ratio, args.trace_depth, args.seed)
+    ]
+    size = args.files_per_request
+    batches = [payloads[i:i + size] for i in range(0, len(payloads), size)]
+    return [batches[i % len(batches)] for i in range(args.requests)]
+
+async def run_load(client: httpx.AsyncClient, batches, concurrency: int, async_ingest: bool):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def upload(batch):
+        nonlocal failures
+        files = [("files", (filename, payload, "application/json")) for filename, payload in batch]
+        params = {"build_id": f"bench-{uuid.uuid4()}"}
+        if async_ingest:
+            params["async"] = "true"
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/v1/result/upload", files=files, params=params)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(upload(batch) for batch in batches))
+    return latencies, failures, time.perf_counter() - started
+
+async def main_async(args):
+    batches = build_requests(args)
+    files = sum(len(batch) for batch in batches)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        install_stub_backend(args.model_latency)
+        from app.main import app
+        if args.init_db:
+            from app.db.init_db import init_db
+            await init_db()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=args.timeout)
+
+    async with client:
+        # The analysis stage reports every class it sends to the model
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies, failures, elapsed = await run_load(client, batches, args.concurrency, args.async_ingest)
+
+    report(
+        "upload" + ("[async]" if args.async_ingest else ""),
+        latencies,
+        files,
+        elapsed,
+        requests_per_sec=round(len(batches) / elapsed, 1) if elapsed else 0.0,
+        failed_requests=failures,
+        concurrency=args.concurrency,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Base URL of a running server; in-process when omitted")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--files-per-request", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--async-ingest", action="store_true", help="Queue uploads for the worker (async=true)")
+    parser.add_argument("--classes", type=int, default=100)
+    parser.add_argument("--tests-per-class", type=int, default=10)
+    parser.add_argument("--failure-ratio", type=float, default=0.1)
+    parser.add_argument("--trace-depth", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Seconds the stub backend waits per request")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--init-db", action="store_true", help="Create the schema and tables before the run")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Shared helpers for the benchmarks: environment, stub backend, statistics and reporting."""
+import json
+import os
+import resource
+import sys
+from typing import Any, Dict, List
+
+def configure_environment():
+    """Offline analysis with LLM rate limiting disabled.
+
+    Must run before anything from ``app`` is imported.
+    """
+    os.environ.setdefault("ANALYSIS_BACKEND", "stub")
+    os.environ.setdefault("LLM_RPM", "0")
+    os.environ.setdefault("LLM_TPM", "0")
+
+def install_stub_backend(latency: float = 0.0):
+    """Switch analysis to the deterministic stub backend with the given latency."""
+    from app.core.config import settings
+    from app.core.llm import get_backend
+    settings.ANALYSIS_BACKEND = "stub"
+    settings.ANALYSIS_STUB_LATENCY_SECONDS = latency
+    get_backend.cache_clear()
+    return get_backend()
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def report(name: str, latencies: List[float], items: int, elapsed: float, unit: str = "files", **extra: Any) -> Dict[str, Any]:
+    """Print and return one benchmark result line."""
+    result = {
+        "benchmark": name,
+        f"{unit}_per_sec": round(items / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "iterations": len(latencies),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    result.update(extra)
+    print(json.dumps(result))
+    return result
@@ -0,0 +1,138 @@
+"""Seeded generator of Allure-style ``*-result.json`` test results.
+
+Usage:
+    python -m benchmarks.generate --classes 200 --failure-ratio 0.2 --out /tmp/allure-results
+    python -m benchmarks.generate --classes 50 --ndjson > results.ndjson
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import uuid
+from typing import Any, Dict, Iterator
+
+PACKAGES = ["com.acme.billing", "com.acme.orders", "com.acme.auth", "com.acme.search", "com.acme.inventory"]
+NOUNS = ["Invoice", "Order", "Session", "Token", "Query", "Cart", "Payment", "Account", "Stock", "Report"]
+VERBS = ["create", "update", "delete", "find", "validate", "refresh", "export", "sync", "apply", "cancel"]
+
+# Root causes shared across classes, with volatile parts (IDs, ports,
+# timestamps) like real failures have
+FAILURES = [
+    ("java.net.ConnectException", "Connection refused: localhost/127.0.0.1:{port}"),
+    ("java.lang.AssertionError", "expected:<{a}> but was:<{b}>"),
+    ("java.lang.NullPointerException", "Cannot invoke \"{noun}.getId()\" because \"{var}\" is null"),
+    ("org.opentest4j.AssertionFailedError", "Request {uuid} returned status 500 at {timestamp}"),
+    ("java.util.concurrent.TimeoutException", "Timed out after {a} ms waiting for {noun}Service"),
+    ("java.lang.IllegalStateException", "{noun} {a} is already locked by thread {b}"),
+]
+
+FRAMEWORK_FRAMES = [
+    "org.junit.runners.model.FrameworkMethod$1.runReflectiveCall(FrameworkMethod.java:59)",
+    "org.junit.internal.runners.model.ReflectiveCallable.run(ReflectiveCallable.java:12)",
+    "org.junit.runners.ParentRunner.runLeaf(ParentRunner.java:366)",
+    "sun.reflect.NativeMethodAccessorImpl.invoke0(Native Method)",
+    "jdk.internal.reflect.DirectMethodHandleAccessor.invoke(DirectMethodHandleAccessor.java:103)",
+    "java.base/java.lang.reflect.Method.invoke(Method.java:580)",
+    "org.gradle.api.internal.tasks.testing.junit.JUnitTestClassExecutor.execute(JUnitTestClassExecutor.java:58)",
+]
+
+def _trace(rng: random.Random, exception: str, message: str, class_name: str, method: str, depth: int) -> str:
+    package = class_name.rsplit(".", 1)[0]
+    simple = class_name.rsplit(".", 1)[1]
+    lines = [f"{exception}: {message}"]
+    for level in range(depth):
+        if level == 0:
+            lines.append(f"\tat {class_name}.{method}({simple}.java:{rng.randint(20, 400)})")
+        elif level < depth // 3:
+            noun = rng.choice(NOUNS)
+            lines.append(f"\tat {package}.{noun}Service.{rng.choice(VERBS)}({noun}Service.java:{rng.randint(10, 900)})")
+        else:
+            lines.append(f"\tat {rng.choice(FRAMEWORK_FRAMES)}")
+    lines.append(f"\t... {rng.randint(10, 60)} more")
+    return "\n".join(lines)
+
+def generate_results(
+        classes: int = 100,
+        tests_per_class: int = 10,
+        failure_ratio: float = 0.1,
+        trace_depth: int = 40,
+        seed: int = 42
+        ) -> Iterator[Dict[str, Any]]:
+    """Yield one Allure result dict per test method, deterministically for a given seed."""
+    rng = random.Random(seed)
+    start = 1_700_000_000_000
+    for class_index in range(classes):
+        package = PACKAGES[class_index % len(PACKAGES)]
+        class_name = f"{package}.{rng.choice(NOUNS)}{class_index}Test"
+        # Failing classes tend to share a root cause across their methods
+        exception, template = rng.choice(FAILURES)
+        for test_index in range(tests_per_class):
+            method = f"{rng.choice(VERBS)}{rng.choice(NOUNS)}{test_index}"
+            duration = rng.randint(5, 5000)
+            result = {
+                "uuid": str(uuid.UUID(int=rng.getrandbits(128))),
+                "historyId": f"{rng.getrandbits(64):016x}",
+                "name": method,
+                "fullName": f"{class_name}.{method}",
+                "status": "passed",
+                "start": start,
+                "stop": start + duration,
+                "labels": [
+                    {"name": "testClass", "value": class_name},
+                    {"name": "testMethod", "value": method},
+                    {"name": "package", "value": package},
+                    {"name": "suite", "value": class_name.rsplit(".", 1)[1]},
+                    {"name": "framework", "value": "junit4"},
+                    {"name": "language", "value": "java"},
+                    {"name": "host", "value": f"ci-agent-{rng.randint(1, 12)}"},
+                ],
+                "steps": [],
+                "attachments": [],
+                "parameters": [],
+            }
+            start += duration
+            roll = rng.random()
+            if roll < failure_ratio:
+                result["status"] = "failed" if rng.random() < 0.8 else "broken"
+                message = template.format(
+                    port=rng.randint(1024, 65535),
+                    a=rng.randint(0, 10000),
+                    b=rng.randint(0, 10000),
+                    noun=rng.choice(NOUNS),
+                    var=rng.choice(["order", "session", "item"]),
+                    uuid=uuid.UUID(int=rng.getrandbits(128)),
+                    timestamp=f"2024-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T1{rng.randint(0, 9)}:2{rng.randint(0, 9)}:0{rng.randint(0, 9)}Z",
+                )
+                result["statusMessage"] = message
+                result["statusTrace"] = _trace(rng, exception, message, class_name, method, trace_depth)
+            elif roll < failure_ratio + 0.02:
+                result["status"] = "skipped"
+            yield result
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic Allure result files")
+    parser.add_argument("--classes", type=int, default=100)
+    parser.add_argument("--tests-per-class", type=int, default=10)
+    parser.add_argument("--failure-ratio", type=float, default=0.1)
+    parser.add_argument("--trace-depth", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Directory to write one <uuid>-result.json per test into")
+    parser.add_argument("--ndjson", action="store_true", help="Write newline-delimited results to stdout")
+    args = parser.parse_args()
+
+    results = generate_results(args.classes, args.tests_per_class, args.failure_ratio, args.trace_depth, args.seed)
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        count = 0
+        for result in results:
+            with open(os.path.join(args.out, f"{result['uuid']}-result.json"), "w") as f:
+                json.dump(result, f)
+            count += 1
+        print(f"Wrote {count} results to {args.out}", file=sys.stderr)
+    else:
+        for result in results:
+            sys.stdout.write(json.dumps(result) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+
+# Analyses never leave the process in tests: deterministic answers, no quota
+os.environ.setdefault("ANALYSIS_BACKEND", "stub")
+os.environ.setdefault("LLM_RPM", "0")
+os.environ.setdefault("LLM_TPM", "0")
@@ -0,0 +1,18 @@
+"""Invalidation of the in-process class read cache."""
+from app.core import readcache
+
+def test_read_started_before_invalidation_is_not_cached():
+    started = readcache.read_started()
+    readcache.invalidate(["StaleClass"])
+    readcache.put("StaleClass", 1, "summary", b"{}", started)
+    assert readcache.current_version("StaleClass") is None
+
+    readcache.put("StaleClass", 2, "summary", b"{}", readcache.read_started())
+    assert readcache.current_version("StaleClass") == 2
+    assert readcache.get_body("StaleClass", 2, "summary") == b"{}"
+
+def test_invalidation_of_other_classes_keeps_reads_cacheable():
+    started = readcache.read_started()
+    readcache.invalidate(["OtherClass"])
+    readcache.put("FreshClass", 3, "summary", b"{}", started)
+    assert readcache.current_version("FreshClass") == 3
@@ -0,0 +1,29 @@
+"""Incremental decoding of uploaded test records."""
+import pytest
+from app.core.stream import iter_records
+
+RECORD = b'{"name": "a", "status": "passed"}'
+
+def _split(content, size=7):
+    return [content[start:start + size] for start in range(0, len(content), size)]
+
+@pytest.mark.parametrize("content", [
+    RECORD,
+    b'[' + RECORD + b', ' + RECORD + b']',
+    RECORD + b'\n' + RECORD + b'\n',
+    b'[' + RECORD + b'] [' + RECORD + b']',
+])
+def test_accepts_objects_arrays_and_ndjson(content):
+    records = list(iter_records(_split(content)))
+    assert records and all(record["name"] == "a" for record in records)
+
+@pytest.mark.parametrize("content", [
+    b'[' + RECORD + b',',
+    b'[' + RECORD,
+    b'[' + RECORD + b', {"name": "b"',
+    RECORD + b']',
+    RECORD + b', ' + RECORD,
+])
+def test_rejects_truncated_or_malformed_streams(content):
+    with pytest.raises(ValueError):
+        list(iter_records(_split(content)))
@@ -0,0 +1,211 @@
+"""Uploads through the async ingestion path.
+
+The first tests run anywhere: statements are compiled for asyncpg by a
+recording session and their bound values checked. The last one needs the
+Postgres configured by the DB_* variables and is skipped without it.
+"""
+import asyncio
+import io
+import json
+import uuid
+import zipfile
+from datetime import datetime
+import pytest
+from sqlalchemy.sql.dml import Delete
+from sqlalchemy.dialects.postgresql.asyncpg import dialect as asyncpg_dialect
+from benchmarks.generate import generate_results
+from app.core.ingest import ingest_build, ingest_files, stored_records, upload_records
+from app.models import IngestionJob, IngestionJobFile
+from app import worker
+from app.worker import claim_job, process_job
+
+ASYNCPG = asyncpg_dialect()
+
+class RecordedResult:
+    rowcount = 1
+
+    def scalar_one(self):
+        return 1
+
+    def scalars(self):
+        return self
+
+    def first(self):
+        return None
+
+    def all(self):
+        return []
+
+    def __iter__(self):
+        return iter(())
+
+class RecordingSession:
+    """Stands in for an AsyncSession, keeping every bound value asyncpg would encode."""
+
+    def __init__(self):
+        self.values = []
+        self.in_transaction = False
+
+    async def execute(self, statement, params=None):
+        self.in_transaction = True
+        compiled = statement.compile(dialect=ASYNCPG)
+        self.values.extend(compiled.params.values())
+        for row in params or []:
+            self.values.extend(row.values())
+        return RecordedResult()
+
+    async def commit(self):
+        self.in_transaction = False
+
+    async def rollback(self):
+        self.in_transaction = False
+
+def _aware(values):
+    return [value for value in values if isinstance(value, datetime) and value.tzinfo is not None]
+
+def _upload(classes=5, seed=7):
+    content = json.dumps(list(generate_results(classes=classes, tests_per_class=4, failure_ratio=0.5, trace_depth=8, seed=seed)))
+    return [("results.json", content.encode())]
+
+async def _chunks(content, size=4096):
+    for start in range(0, len(content), size):
+        yield content[start:start + size]
+
+def _stored(files):
+    """Files as stored for a queued job, read back a chunk at a time."""
+    return stored_records([(name, _chunks(content)) for name, content in files])
+
+def test_upload_binds_only_naive_timestamps():
+    # asyncpg rejects timezone-aware values for the TIMESTAMP WITHOUT TIME ZONE columns
+    session = RecordingSession()
+    outcomes = asyncio.run(ingest_build(_stored(_upload()), session))
+    assert [outcome['status'] for outcome in outcomes] == ['ok']
+    assert any(isinstance(value, datetime) for value in session.values)
+    assert _aware(session.values) == []
+
+def test_staged_upload_binds_only_naive_timestamps():
+    session = RecordingSession()
+    asyncio.run(ingest_build(_stored(_upload()), session, build_id="build-1", final=False))
+    assert _aware(session.values) == []
+
+def test_no_transaction_is_open_during_model_calls(monkeypatch):
+    from app.core import utils
+    session = RecordingSession()
+    open_during_calls = []
+    request = utils.request_failure_analysis_async
+
+    async def recording_request(failure_input):
+        open_during_calls.append(session.in_transaction)
+        return await request(failure_input)
+
+    monkeypatch.setattr(utils, "request_failure_analysis_async", recording_request)
+    # Unique failures, so neither the cache nor the similarity index answers
+    asyncio.run(ingest_build(_stored(_upload(seed=uuid.uuid4().int)), session, build_id="build-2"))
+    assert open_during_calls and not any(open_during_calls)
+
+def _archive(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in members:
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+def test_process_job_reports_outcomes_per_job_file(monkeypatch):
+    results = [json.dumps(result).encode() for result in generate_results(classes=2, tests_per_class=2, failure_ratio=0, trace_depth=4, seed=3)]
+    contents = {
+        1: _archive([("a-result.json", results[0]), ("b-result.json", b"{broken"), ("c-result.json", results[1])]),
+        2: results[2],
+        3: _archive([("screenshot.png", b"png")]),
+        4: results[3],
+    }
+    job_files = [
+        IngestionJobFile(id=1, filename="results.zip"),
+        IngestionJobFile(id=2, filename="d-result.json"),
+        IngestionJobFile(id=3, filename="empty.zip"),
+        IngestionJobFile(id=4, filename="e-result.json"),
+    ]
+    session = RecordingSession()
+    execute = session.execute
+    statements = []
+
+    async def execute_selecting_job_files(statement, params=None):
+        result = await execute(statement, params)
+        if not statements:
+            result.all = lambda: job_files
+        statements.append(statement)
+        return result
+
+    monkeypatch.setattr(session, "execute", execute_selecting_job_files)
+    monkeypatch.setattr(worker, "stored_chunks", lambda session, job_file_id: _chunks(contents[job_file_id]))
+    asyncio.run(process_job(session, IngestionJob(id=1, attempts=1, build_id=None, final=True)))
+
+    archive, plain, empty, last = (job_file.outcome for job_file in job_files)
+    assert archive["status"] == "error" and archive["records"] == 2
+    assert [member["status"] for member in archive["members"]] == ["ok", "error", "ok"]
+    assert plain["file"] == "d-result.json" and plain["status"] == "ok"
+    assert empty["status"] == "error" and empty["members"] == []
+    assert last["file"] == "e-result.json" and last["status"] == "ok"
+    # The stored chunks are dropped with the results
+    assert any(isinstance(statement, Delete) and statement.table.name == "ingestion_job_chunks" for statement in statements)
+
+def test_upload_reports_one_outcome_per_file():
+    from starlette.datastructures import UploadFile
+    (name, content), = _upload(classes=2)
+    files = [
+        UploadFile(io.BytesIO(_archive([("a-result.json", content)])), filename="results.zip"),
+        UploadFile(io.BytesIO(_archive([("screenshot.png", b"png")])), filename="empty.zip"),
+        UploadFile(io.BytesIO(content), filename=name),
+    ]
+    outcomes = asyncio.run(ingest_files([(file.filename, upload_records([file])) for file in files], RecordingSession()))
+    assert [(outcome["file"], outcome["status"]) for outcome in outcomes] == [
+        ("results.zip", "ok"), ("empty.zip", "error"), ("results.json", "ok")
+    ]
+    assert [member["file"] for member in outcomes[0]["members"]] == ["results.zip/a-result.json"]
+
+def test_claim_job_binds_only_naive_timestamps():
+    session = RecordingSession()
+    assert asyncio.run(claim_job(session)) is None
+    assert any(isinstance(value, datetime) for value in session.values)
+    assert _aware(session.values) == []
+
+async def _database_available() -> bool:
+    from app.db.init_db import async_engine
+    try:
+        async with async_engine.connect():
+            return True
+    except Exception:
+        return False
+    finally:
+        await async_engine.dispose()
+
+def test_upload_through_async_engine():
+    httpx = pytest.importorskip("httpx")
+    if not asyncio.run(_database_available()):
+        pytest.skip("Postgres from the DB_* settings is not reachable")
+    from app.db.init_db import init_db, async_engine
+    from app.main import app
+
+    async def run():
+        await init_db()
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                # A fresh seed gives class names no earlier run has used
+                files = [("files", (name, content)) for name, content in _upload(seed=uuid.uuid4().int)]
+                response = await client.post("/v1/result/upload", files=files)
+                assert response.status_code == 200, response.text
+                outcome = response.json()["files"][0]
+                assert outcome["status"] == "ok"
+                class_name = outcome["classes"][0]
+                summary = await client.get(f"/v1/result/{class_name}")
+                assert summary.status_code == 200
+                assert summary.json()["total_tests"] == 4
+                assert summary.json()["version"] == 1
+                not_modified = await client.get(
+                    f"/v1/result/{class_name}", headers={"If-None-Match": summary.headers["etag"]}
+                )
+                assert not_modified.status_code == 304
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(run())